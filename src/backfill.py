@@ -0,0 +1,244 @@
+import argparse
+from collections import deque
+from datetime import datetime
+from db_config import get_connection, initialise_db
+import gzip
+import io
+import json
+from parallel_extractor import extract_items
+from pathlib import Path
+from scraper import ScrapedItem
+from text_normaliser import normalise_post, normalise_text
+from ticker_extractor import get_ticker_extractor, record_mentions
+import time
+
+# zstandard is only needed for .zst dumps, so it is not part of requirements.txt
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+"""
+seeds the mentions table with history by streaming Reddit-style submission and
+comment dumps (newline-delimited JSON, plain, .gz or .zst) from local disk, running
+each record through the same cleaning and TickerExtractor as the live scraper
+
+dumps are read one line at a time, so memory stays flat however large the file...
+mentions are written in batches of CHECKPOINT_ITEMS items, and after each batch the
+uncompressed byte offset reached is saved to the backfill_checkpoints table, an
+interrupted load picks up from there on the next run (a batch that was written but
+not yet checkpointed is simply read again, which INSERT OR IGNORE makes harmless)
+
+run from the src folder:
+    python3 backfill.py dumps/wallstreetbets_comments.zst --subreddits wallstreetbets
+"""
+
+# items (posts/comments) between mention writes and checkpoints
+CHECKPOINT_ITEMS = 20000
+# seconds between progress lines
+PROGRESS_INTERVAL = 10
+# the Pushshift style dumps are compressed with a long window that the decompressor
+# has to be told to accept
+ZSTD_MAX_WINDOW_SIZE = 2 ** 31
+
+class DumpReader:
+    '''
+    yields a ScrapedItem for every relevant record of a dump, from a given offset,
+    and remembers the position each yielded item ended at so the consumer can
+    checkpoint exactly what it has processed
+    '''
+    def __init__(self, path: Path, start_offset: int, start_lines: int, subreddits: set[str]):
+        self.path = path
+        self.offset = start_offset
+        self.lines_read = start_lines
+        self.malformed = 0
+        # (byte_offset, lines_read) after each yielded item, in yield order
+        self.positions = deque()
+        self.__subreddits = subreddits
+        self.__raw_file = None
+
+    def open(self):
+        self.__raw_file = open(self.path, "rb")
+
+        if self.path.suffix == ".gz":
+            stream = gzip.GzipFile(fileobj=self.__raw_file)
+        elif self.path.suffix == ".zst":
+            if zstandard is None:
+                raise ImportError("Reading .zst dumps requires the zstandard package (pip install zstandard)")
+            decompressor = zstandard.ZstdDecompressor(max_window_size=ZSTD_MAX_WINDOW_SIZE)
+            stream = decompressor.stream_reader(self.__raw_file)
+        else:
+            stream = self.__raw_file
+
+        # compressed streams can only seek forward by decompressing up to the
+        # offset, which is still far cheaper than parsing those lines again
+        if self.offset:
+            stream.seek(self.offset)
+
+        return io.BufferedReader(stream) if self.path.suffix == ".zst" else stream
+
+    def close(self):
+        if self.__raw_file:
+            self.__raw_file.close()
+
+    @property
+    def fraction_read(self) -> float:
+        # position in the file on disk, only approximate for compressed dumps as
+        # the decompressor reads ahead
+        return self.__raw_file.tell() / max(self.path.stat().st_size, 1)
+
+    def items(self, stream):
+        for line in stream:
+            self.offset += len(line)
+            self.lines_read += 1
+
+            try:
+                record = json.loads(line)
+            except ValueError:
+                self.malformed += 1
+                continue
+
+            item = self.parse_record(record)
+            if item is not None:
+                self.positions.append((self.offset, self.lines_read))
+                yield item
+
+    def parse_record(self, record: dict):
+        subreddit = record.get("subreddit")
+        if not subreddit or (self.__subreddits and subreddit.lower() not in self.__subreddits):
+            return None
+
+        # prevents us from wasting processing on subreddit bot "comments"
+        if record.get("author") == "AutoModerator":
+            return None
+
+        try:
+            if "body" in record:
+                link_id = record["link_id"]
+                post_id = link_id[3:] if link_id.startswith("t3_") else link_id
+                return ScrapedItem(
+                    text=normalise_text(record["body"]), post_id=post_id,
+                    comment_id=record["id"], timestamp=float(record["created_utc"]),
+                    subreddit=subreddit
+                )
+
+            if "title" in record:
+                return ScrapedItem(
+                    text=normalise_post(record["title"], record.get("selftext", "")),
+                    post_id=record["id"], timestamp=float(record["created_utc"]),
+                    subreddit=subreddit
+                )
+
+        except (KeyError, TypeError, ValueError):
+            self.malformed += 1
+
+        return None
+
+def read_checkpoint(path: Path) -> tuple[int, int]:
+    cursor = get_connection().cursor()
+    cursor.execute(
+        '''SELECT byte_offset, lines_read FROM backfill_checkpoints WHERE dump_path = ?''',
+        (str(path),)
+    )
+    checkpoint = cursor.fetchone()
+
+    return checkpoint if checkpoint else (0, 0)
+
+def save_checkpoint(path: Path, byte_offset: int, lines_read: int):
+    connection = get_connection()
+
+    try:
+        connection.execute(
+            '''INSERT INTO backfill_checkpoints (dump_path, byte_offset, lines_read, updated_at)
+            VALUES (?, ?, ?, ?) ON CONFLICT (dump_path) DO UPDATE SET
+            byte_offset = excluded.byte_offset, lines_read = excluded.lines_read,
+            updated_at = excluded.updated_at''',
+            (str(path), byte_offset, lines_read, time.time())
+        )
+        connection.commit()
+
+    except Exception as e:
+        print(f"FATAL ERROR: Failed to save backfill checkpoint for {path}: {e}")
+        connection.rollback()
+        raise
+
+def backfill_dump(path: Path, subreddits: set[str] = None, workers: int = None,
+                  restart: bool = False):
+    path = path.resolve()
+    start_offset, start_lines = (0, 0) if restart else read_checkpoint(path)
+    if start_offset:
+        print(f"[{datetime.now()}] Resuming {path.name} from line {start_lines:,} (byte {start_offset:,})")
+
+    ticker_extractor = get_ticker_extractor()
+    reader = DumpReader(path, start_offset, start_lines, subreddits or set())
+    stream = reader.open()
+
+    items_done = 0
+    inserted_total = 0
+    ignored_total = 0
+    pending = []
+    checkpoint = (start_offset, start_lines)
+    started = time.monotonic()
+    last_progress = started
+
+    def flush():
+        nonlocal inserted_total, ignored_total
+        inserted, ignored = record_mentions(pending)
+        inserted_total += inserted
+        ignored_total += ignored
+        pending.clear()
+        save_checkpoint(path, *checkpoint)
+
+    try:
+        # inline_threshold=0 always uses the process pool, a dump is never small
+        for item, tickers in extract_items(ticker_extractor, reader.items(stream), workers, 0):
+            checkpoint = reader.positions.popleft()
+            items_done += 1
+            if tickers:
+                pending.append((item, tickers))
+
+            if items_done % CHECKPOINT_ITEMS == 0:
+                flush()
+
+            now = time.monotonic()
+            if now - last_progress >= PROGRESS_INTERVAL:
+                last_progress = now
+                elapsed = now - started
+                print(
+                    f"[{datetime.now()}] {path.name}: {reader.fraction_read:.1%} of file, "
+                    f"{reader.lines_read - start_lines:,} lines, {items_done:,} items, "
+                    f"{inserted_total:,} mentions recorded, "
+                    f"{(reader.lines_read - start_lines) / elapsed:,.0f} lines/s, "
+                    f"{(reader.offset - start_offset) / elapsed / 1e6:.1f} MB/s"
+                )
+
+        # the lines after the last relevant item still count as read
+        checkpoint = (reader.offset, reader.lines_read)
+        flush()
+
+    finally:
+        reader.close()
+
+    elapsed = time.monotonic() - started
+    print(
+        f"[{datetime.now()}] Finished {path.name} in {elapsed:.0f}s: {items_done:,} items, "
+        f"{inserted_total:,} mentions recorded, {ignored_total:,} already recorded, "
+        f"{reader.malformed:,} malformed lines skipped."
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill mentions from Reddit NDJSON dumps")
+    parser.add_argument("dumps", nargs="+", type=Path, help=".ndjson/.json, .gz or .zst dump files")
+    parser.add_argument("--subreddits", nargs="*", help="only load these subreddits")
+    parser.add_argument("--workers", type=int, help="extraction processes, defaults to one per core")
+    parser.add_argument("--restart", action="store_true", help="ignore saved checkpoints")
+    args = parser.parse_args()
+
+    initialise_db()
+    subreddits = {subreddit.lower() for subreddit in args.subreddits or []}
+
+    for dump in args.dumps:
+        backfill_dump(dump, subreddits, args.workers, args.restart)
+
+if __name__ == "__main__":
+    main()
@@ -19,9 +19,11 @@ blacklisted_words is composed of random_dnc or "random do consider" and the prof
 list, if these words are matched, regardless of case, they are always filtered out
 """
 
-def load_blacklist_files() -> set:
-    current_dir = Path(__file__).resolve()
-    blacklists_dir = current_dir.parent.parent / "blacklists"
+CURRENT_DIR = Path(__file__).resolve()
+BLACKLISTS_DIR = CURRENT_DIR.parent.parent / "blacklists"
+
+def load_blacklist_files() -> tuple[set, set, set]:
+    blacklists_dir = BLACKLISTS_DIR
     regular_words_file = blacklists_dir / "regular_words.txt"
     random_words_dc_file = blacklists_dir / "random_dc.txt"
 
@@ -50,9 +52,9 @@ def load_blacklist_files() -> set:
         for word in random_do_consider:
             random_words_dc.update(word.upper() for word in random_do_consider)
 
-    return sorted(blacklisted_words), sorted(regular_words_list), sorted(random_words_dc)
+    return blacklisted_words, regular_words_list, random_words_dc
 
 if __name__ == "__main__":
     blacklisted_words, regular_words, random_words_dc = load_blacklist_files()
-    for word in random_words_dc:
+    for word in sorted(random_words_dc):
         print(word)
@@ -0,0 +1,86 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from scraper import Scraper, ScrapedItem
+import threading
+from typing import Iterator
+from urllib.parse import urlparse
+
+"""
+fetches the post listings of every subreddit and the comment pages of every post
+in parallel using a bounded thread pool, so a scrape takes roughly as long as its
+slowest requests rather than the sum of all of them
+
+only the network calls are fanned out to the pool, validation against the post and
+comment caches and the yielding of ScrapedItems stay on the calling thread and keep
+the same order as a sequential scrape, which means the TickerExtractor and the cache
+tables are fed exactly as they would be by Scraper.scrape_data
+"""
+
+class HostLimiter:
+    """
+    caps the number of in-flight requests to any single host, the thread pool
+    size acts as the global cap while this keeps us from opening every one of
+    those connections against the same server
+    """
+    def __init__(self, max_per_host: int):
+        self.__max_per_host = max_per_host
+        self.__semaphores = {}
+        self.__lock = threading.Lock()
+
+    def run(self, url: str, fetch, *args):
+        host = urlparse(url).netloc
+
+        with self.__lock:
+            semaphore = self.__semaphores.get(host)
+            if semaphore is None:
+                semaphore = threading.BoundedSemaphore(self.__max_per_host)
+                self.__semaphores[host] = semaphore
+
+        with semaphore:
+            return fetch(*args)
+
+def scrape_subreddits_concurrently(scrapers: list[Scraper], max_workers: int,
+                                   max_per_host: int) -> Iterator[ScrapedItem]:
+    limiter = HostLimiter(max_per_host)
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="scrape") as executor:
+        # every listing is requested up front, along with the comment stream of the
+        # subreddits that read their comments from it
+        listing_futures = [
+            executor.submit(limiter.run, scraper.BASE_URL, scraper.fetch_posts)
+            for scraper in scrapers
+        ]
+        stream_futures = [
+            executor.submit(limiter.run, scraper.BASE_URL, scraper.fetch_comment_stream)
+            if scraper.comment_stream else None
+            for scraper in scrapers
+        ]
+
+        # as soon as any listing arrives, the comment pages of all of its posts are
+        # queued, so one slow subreddit never holds up the comment fetches of another
+        comment_futures = [None] * len(scrapers)
+        comment_targets = [None] * len(scrapers)
+        scraper_indexes = {future: i for i, future in enumerate(listing_futures)}
+        for listing_future in as_completed(listing_futures):
+            i = scraper_indexes[listing_future]
+            scraper = scrapers[i]
+            if scraper.comment_stream:
+                comment_targets[i] = comment_futures[i] = []
+                continue
+            
+            comment_targets[i] = scraper.get_comment_targets(listing_future.result())
+            comment_futures[i] = [
+                executor.submit(limiter.run, scraper.BASE_URL, scraper.fetch_comments, post_id)
+                for post_id in comment_targets[i]
+            ]
+
+        for scraper, listing_future, stream_future, post_ids, post_comment_futures in zip(
+            scrapers, listing_futures, stream_futures, comment_targets, comment_futures
+        ):
+            yield from scraper.process_posts(listing_future.result())
+            if stream_future:
+                yield from scraper.process_comment_stream(stream_future.result())
+
+            for post_id, comments_future in zip(post_ids, post_comment_futures):
+                print(post_id)
+
+                yield from scraper.process_comments(post_id, comments_future.result())
@@ -1,16 +1,196 @@
 from pathlib import Path
 import sqlite3
+import sys
+import threading
 
 """
 initialises the database and creates mentions, post_cache and comment_cache
 tables if they do not exist
+
+also hands out long-lived connections, one per thread, so the hot paths of the
+scraper, extractor and dashboard don't pay for a connect() on every item...the
+database runs in WAL mode, which lets the scheduler write while the dashboard
+reads without either of them waiting on the other's lock
 """
 
 CURRENT_DIR = Path(__file__).resolve()
 # even if file is not yet made, establish the path to give to sqlite3
 DB_PATH = CURRENT_DIR.parent.parent / "database" / "reddit_ticker_data.db"
 
+# seconds a connection waits on a locked database before raising
+BUSY_TIMEOUT = 10
+# how many compiled statements each connection keeps around for reuse, sqlite3
+# caches them by SQL text so every repeated query after the first skips parsing
+CACHED_STATEMENTS = 256
+# applied to every connection handed out by get_connection, synchronous=NORMAL is
+# safe under WAL (a crash can only lose the last commits, never corrupt the db),
+# negative cache_size is in KiB
+CONNECTION_PRAGMAS = {
+    "synchronous": "NORMAL",
+    "cache_size": -32000,
+    "mmap_size": 268435456,
+    "temp_store": "MEMORY",
+}
+
+# widths, in seconds, of the mention rollup buckets
+HOUR = 3600
+DAY = 86400
+
+# recomputes both rollup tables from the raw mentions, used by the migration that
+# introduces them and by rebuild_mention_rollups
+ROLLUP_REBUILD_STATEMENTS = [
+    "DELETE FROM mention_counts_hourly",
+    "DELETE FROM mention_counts_daily",
+    f'''INSERT INTO mention_counts_hourly
+        SELECT CAST(mention_timestamp / {HOUR} AS INTEGER) * {HOUR} AS bucket,
+        ticker_symbol, subreddit, COUNT(*)
+        FROM mentions GROUP BY bucket, ticker_symbol, subreddit''',
+    f'''INSERT INTO mention_counts_daily
+        SELECT bucket_start / {DAY} * {DAY} AS bucket, ticker_symbol, subreddit,
+        SUM(mention_count)
+        FROM mention_counts_hourly GROUP BY bucket, ticker_symbol, subreddit''',
+]
+
+# each entry upgrades the schema by one version, the index of a migration plus one
+# is the user_version a database is at once it has been applied...never edit or
+# reorder an existing entry, append a new one instead
+MIGRATIONS = [
+    # 1: a mention is unique per post/comment and ticker, comment_id is NULL for
+    # posts and NULLs never collide in a unique index, hence the IFNULL...databases
+    # created before the constraint existed may hold duplicates that would stop
+    # the index from being built, so those are removed first
+    [
+        '''DELETE FROM mentions WHERE id NOT IN (
+            SELECT MIN(id) FROM mentions GROUP BY post_id, comment_id, ticker_symbol)''',
+        '''CREATE UNIQUE INDEX IF NOT EXISTS idx_mentions_unique
+            ON mentions (post_id, IFNULL(comment_id, ''), ticker_symbol)''',
+    ],
+    # 2: covering indexes for the dashboard queries, get_tickers_by_mention_count
+    # range scans the first, get_mentions_by_ticker seeks the second and reads its
+    # rows already in timestamp order, neither has to touch the table itself
+    [
+        '''CREATE INDEX IF NOT EXISTS idx_mentions_timestamp_ticker
+            ON mentions (mention_timestamp, ticker_symbol)''',
+        '''CREATE INDEX IF NOT EXISTS idx_mentions_ticker_timestamp
+            ON mentions (ticker_symbol, mention_timestamp, post_id, comment_id, subreddit)''',
+        "ANALYZE mentions",
+    ],
+    # 3: hourly and daily per-ticker, per-subreddit mention counts, kept in step
+    # with the mentions table by triggers so they are always updated in the same
+    # transaction as the mention insert (INSERT OR IGNORE skips the trigger for
+    # ignored rows, so duplicates never inflate the counts), then backfilled
+    [
+        '''CREATE TABLE IF NOT EXISTS mention_counts_hourly (
+            bucket_start INTEGER NOT NULL,
+            ticker_symbol TEXT NOT NULL,
+            subreddit TEXT NOT NULL,
+            mention_count INTEGER NOT NULL,
+            PRIMARY KEY (bucket_start, ticker_symbol, subreddit)
+        ) WITHOUT ROWID''',
+        '''CREATE TABLE IF NOT EXISTS mention_counts_daily (
+            bucket_start INTEGER NOT NULL,
+            ticker_symbol TEXT NOT NULL,
+            subreddit TEXT NOT NULL,
+            mention_count INTEGER NOT NULL,
+            PRIMARY KEY (bucket_start, ticker_symbol, subreddit)
+        ) WITHOUT ROWID''',
+        f'''CREATE TRIGGER IF NOT EXISTS mentions_rollup_insert AFTER INSERT ON mentions
+        BEGIN
+            INSERT INTO mention_counts_hourly VALUES (
+                CAST(NEW.mention_timestamp / {HOUR} AS INTEGER) * {HOUR},
+                NEW.ticker_symbol, NEW.subreddit, 1)
+            ON CONFLICT (bucket_start, ticker_symbol, subreddit)
+            DO UPDATE SET mention_count = mention_count + 1;
+            
+            INSERT INTO mention_counts_daily VALUES (
+                CAST(NEW.mention_timestamp / {DAY} AS INTEGER) * {DAY},
+                NEW.ticker_symbol, NEW.subreddit, 1)
+            ON CONFLICT (bucket_start, ticker_symbol, subreddit)
+            DO UPDATE SET mention_count = mention_count + 1;
+        END''',
+        f'''CREATE TRIGGER IF NOT EXISTS mentions_rollup_delete AFTER DELETE ON mentions
+        BEGIN
+            UPDATE mention_counts_hourly SET mention_count = mention_count - 1
+            WHERE bucket_start = CAST(OLD.mention_timestamp / {HOUR} AS INTEGER) * {HOUR}
+            AND ticker_symbol = OLD.ticker_symbol AND subreddit = OLD.subreddit;
+            
+            UPDATE mention_counts_daily SET mention_count = mention_count - 1
+            WHERE bucket_start = CAST(OLD.mention_timestamp / {DAY} AS INTEGER) * {DAY}
+            AND ticker_symbol = OLD.ticker_symbol AND subreddit = OLD.subreddit;
+            
+            DELETE FROM mention_counts_hourly
+            WHERE bucket_start = CAST(OLD.mention_timestamp / {HOUR} AS INTEGER) * {HOUR}
+            AND ticker_symbol = OLD.ticker_symbol AND subreddit = OLD.subreddit
+            AND mention_count <= 0;
+            
+            DELETE FROM mention_counts_daily
+            WHERE bucket_start = CAST(OLD.mention_timestamp / {DAY} AS INTEGER) * {DAY}
+            AND ticker_symbol = OLD.ticker_symbol AND subreddit = OLD.subreddit
+            AND mention_count <= 0;
+        END''',
+        *ROLLUP_REBUILD_STATEMENTS,
+    ],
+    # 4: how far into each dump file a historical backfill has got, so an
+    # interrupted load resumes instead of starting over
+    [
+        '''CREATE TABLE IF NOT EXISTS backfill_checkpoints (
+            dump_path TEXT PRIMARY KEY,
+            byte_offset INTEGER NOT NULL,
+            lines_read INTEGER NOT NULL,
+            updated_at REAL NOT NULL
+        )''',
+    ],
+    # 5: the newest post recorded per subreddit, listings are fetched from there
+    # on rather than re-downloaded in full every run...checked_at is when the
+    # cursor last moved or was confirmed against the top of the listing
+    [
+        '''CREATE TABLE IF NOT EXISTS subreddit_cursors (
+            subreddit TEXT PRIMARY KEY,
+            newest_fullname TEXT NOT NULL,
+            newest_timestamp REAL NOT NULL,
+            checked_at REAL NOT NULL
+        )''',
+    ],
+    # 6: cursors are kept per listing of a subreddit ("new" for posts, "comments"
+    # for the comment stream) rather than per subreddit
+    [
+        '''CREATE TABLE IF NOT EXISTS listing_cursors (
+            subreddit TEXT NOT NULL,
+            listing TEXT NOT NULL,
+            newest_fullname TEXT NOT NULL,
+            newest_timestamp REAL NOT NULL,
+            checked_at REAL NOT NULL,
+            PRIMARY KEY (subreddit, listing)
+        ) WITHOUT ROWID''',
+        '''INSERT INTO listing_cursors SELECT subreddit, 'new', newest_fullname,
+            newest_timestamp, checked_at FROM subreddit_cursors''',
+        "DROP TABLE subreddit_cursors",
+    ],
+    # 7: the generations of each subreddit's rotating Bloom filter of processed
+    # posts and comments, see seen_filter.py...kept as a rowid table, the bit
+    # arrays are far larger than WITHOUT ROWID rows should be
+    [
+        '''CREATE TABLE IF NOT EXISTS seen_filters (
+            subreddit TEXT NOT NULL,
+            started_at REAL NOT NULL,
+            item_count INTEGER NOT NULL,
+            hash_count INTEGER NOT NULL,
+            bits BLOB NOT NULL,
+            PRIMARY KEY (subreddit, started_at)
+        )''',
+    ],
+]
+
+_db_ready = False
+_db_ready_lock = threading.Lock()
+# bumped by close_connections so threads notice their cached connection is gone
+_generation = 0
+_thread_local = threading.local()
+_open_connections = []
+_open_connections_lock = threading.Lock()
+
 def initialise_db():
+    global _db_ready
     connection = None
     
     try:
@@ -21,6 +201,10 @@ def initialise_db():
         connection = sqlite3.connect(DB_PATH)
         cursor = connection.cursor()
         
+        # journal mode is stored in the db file itself, so this only needs to
+        # happen once for every later connection to use WAL
+        cursor.execute("PRAGMA journal_mode=WAL")
+        
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS mentions (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -51,6 +235,12 @@ def initialise_db():
         ''')
 
         connection.commit()
+        
+        migrate_db(connection)
+        # refreshes the planner statistics the indexes above rely on whenever
+        # the table has changed enough since the last boot to need it
+        cursor.execute("PRAGMA optimize")
+        _db_ready = True
     
     except Exception as e:
         print(f"FATAL ERROR: Failed to initialise database: {e}")
@@ -62,12 +252,119 @@ def initialise_db():
         if connection:
             connection.close()
 
+def migrate_db(connection: sqlite3.Connection):
+    '''
+    brings an existing database up to the latest schema version, every pending
+    migration runs in its own transaction together with its user_version bump,
+    so a failure leaves the database at the last fully applied version
+    '''
+    cursor = connection.cursor()
+    cursor.execute("PRAGMA user_version")
+    current_version = cursor.fetchone()[0]
+    
+    for version, statements in enumerate(MIGRATIONS[current_version:], start=current_version + 1):
+        try:
+            cursor.execute("BEGIN")
+            for statement in statements:
+                cursor.execute(statement)
+            # pragmas can't take bound parameters, version is always our own int
+            cursor.execute(f"PRAGMA user_version = {version}")
+            connection.commit()
+            print(f"INFO: Migrated database to schema version {version}.")
+            
+        except Exception as e:
+            print(f"FATAL ERROR: Failed to migrate database to schema version {version}: {e}")
+            connection.rollback()
+            raise
+
+def rebuild_mention_rollups():
+    '''
+    recomputes the hourly and daily rollups from scratch, only needed if mentions
+    were ever written with the triggers missing (e.g. a manually restored table)
+    '''
+    connection = None
+    
+    try:
+        connection = get_connection()
+        cursor = connection.cursor()
+        
+        cursor.execute("BEGIN")
+        for statement in ROLLUP_REBUILD_STATEMENTS:
+            cursor.execute(statement)
+        connection.commit()
+        
+        print("Successfully rebuilt mention rollups.")
+    
+    except Exception as e:
+        print(f"FATAL ERROR: Failed to rebuild mention rollups: {e}")
+        if connection:
+            connection.rollback()
+        raise
+
 def get_db_path() -> Path:
-    if not DB_PATH.exists():
-        print("NON-FATAL ERROR: Database file not found. Initialising new database...")
-        initialise_db()
+    global _db_ready
+    
+    # the schema only needs checking once per process, after that it is held open
+    # by our connections...every entry point (the dashboard included, which never
+    # boots the scheduler) gets a database migrated to the latest schema version
+    if not _db_ready:
+        with _db_ready_lock:
+            if not _db_ready:
+                if not DB_PATH.exists():
+                    print("NON-FATAL ERROR: Database file not found. Initialising new database...")
+                initialise_db()
 
     return DB_PATH
 
+def get_connection() -> sqlite3.Connection:
+    '''
+    returns this thread's connection, opening and configuring it on first use,
+    callers commit or roll back as before but never close it
+    '''
+    connection = getattr(_thread_local, "connection", None)
+    
+    if connection is None or _thread_local.generation != _generation:
+        # check_same_thread is only disabled so close_connections can close every
+        # connection from the shutting down thread, each connection is otherwise
+        # only ever used by the thread that opened it
+        connection = sqlite3.connect(
+            get_db_path(), timeout=BUSY_TIMEOUT, cached_statements=CACHED_STATEMENTS,
+            check_same_thread=False
+        )
+        for pragma, value in CONNECTION_PRAGMAS.items():
+            connection.execute(f"PRAGMA {pragma}={value}")
+        
+        _thread_local.connection = connection
+        _thread_local.generation = _generation
+        with _open_connections_lock:
+            _open_connections.append(connection)
+    
+    return connection
+
+def get_total_changes() -> int:
+    '''
+    rows changed through every open connection, whichever thread owns it
+    '''
+    with _open_connections_lock:
+        return sum(connection.total_changes for connection in _open_connections)
+
+def close_connections():
+    global _db_ready, _generation
+    
+    with _open_connections_lock:
+        for connection in _open_connections:
+            # recommended by sqlite before closing long-lived connections
+            connection.execute("PRAGMA optimize")
+            connection.close()
+        _open_connections.clear()
+        # any thread asking for a connection after this point gets a fresh one
+        _generation += 1
+    
+    _db_ready = False
+
 if __name__ == "__main__":
     initialise_db()
+    
+    # python3 db_config.py rebuild-rollups
+    if sys.argv[1:] == ["rebuild-rollups"]:
+        rebuild_mention_rollups()
@@ -1,58 +1,71 @@
-from db_config import get_db_path
-import sqlite3
+from db_config import DAY, HOUR, get_connection
+import metrics
 
 ''''
 contains all of the queries used by any part of the backend or UI of the project
 '''
 
 def get_tickers_by_mention_count(mentions_since: float) -> set[str]:
-    connection = None
-    
     try:
-        connection = sqlite3.connect(get_db_path())
-        cursor = connection.cursor()
+        with metrics.timed("query", query="tickers_by_mention_count") as timer:
+            connection = get_connection()
+            cursor = connection.cursor()
+        
+            # the window is split at the first hour and day boundaries strictly after
+            # mentions_since, raw rows cover the partial hour at the start, hourly
+            # rollups the partial day after that and daily rollups everything from
+            # then on...rollups are exact counts, so the result matches counting raw
+            # rows while long windows only cost one row per bucket
+            first_hour = (int(mentions_since) // HOUR + 1) * HOUR
+            first_day = (int(mentions_since) // DAY + 1) * DAY
         
-        cursor.execute('''
-            SELECT ticker_symbol, COUNT(ticker_symbol) as mention_count
-            FROM mentions WHERE mention_timestamp > ? GROUP BY ticker_symbol
-            ORDER BY mention_count DESC''', (mentions_since,)
-        )
+            cursor.execute('''
+                SELECT ticker_symbol, SUM(mention_count) as mention_count FROM (
+                    SELECT ticker_symbol, COUNT(*) AS mention_count FROM mentions
+                    WHERE mention_timestamp > ? AND mention_timestamp < ?
+                    GROUP BY ticker_symbol
+                    UNION ALL
+                    SELECT ticker_symbol, SUM(mention_count) FROM mention_counts_hourly
+                    WHERE bucket_start >= ? AND bucket_start < ?
+                    GROUP BY ticker_symbol
+                    UNION ALL
+                    SELECT ticker_symbol, SUM(mention_count) FROM mention_counts_daily
+                    WHERE bucket_start >= ?
+                    GROUP BY ticker_symbol
+                ) GROUP BY ticker_symbol
+                ORDER BY mention_count DESC''',
+                (mentions_since, first_hour, first_hour, first_day, first_day)
+            )
         
-        ranked_tickers = cursor.fetchall()
+            ranked_tickers = cursor.fetchall()
+            timer.items = len(ranked_tickers)
         
         return ranked_tickers
         
     except Exception as e:
         print("FATAL ERROR: Failed to retrieve tickers by mention count for dashboard: {e}")
         raise
-        
-    finally:
-        if connection:
-            connection.close()
             
 def get_mentions_by_ticker(ticker: str):
-    connection = None
-    
     try:
-        connection = sqlite3.connect(get_db_path())
-        cursor = connection.cursor()
+        with metrics.timed("query", query="mentions_by_ticker") as timer:
+            connection = get_connection()
+            cursor = connection.cursor()
 
-        cursor.execute('''
-            SELECT ticker_symbol, post_id, comment_id, mention_timestamp, subreddit 
-            FROM mentions
-            WHERE ticker_symbol = ?
-            ORDER BY mention_timestamp DESC
-        ''', (ticker, )
-        )
+            cursor.execute('''
+                SELECT ticker_symbol, post_id, comment_id, mention_timestamp, subreddit 
+                FROM mentions
+                WHERE ticker_symbol = ?
+                ORDER BY mention_timestamp DESC
+            ''', (ticker, )
+            )
+            
+            mentions = cursor.fetchall()
+            timer.items = len(mentions)
         
-        mentions = cursor.fetchall()
         return mentions
     
     except Exception as e:
         print("FATAL ERROR: Failed to retrieve mentions by ticker for dashboard: {e}")
         raise
-    
-    finally:
-        if connection:
-            connection.close()
 
@@ -36,6 +36,10 @@ def clear_all_tables():
     cursor.execute('DELETE FROM post_cache')
     cursor.execute('DELETE FROM comment_cache')
     cursor.execute('DELETE FROM mentions')
+    # without the caches and mentions these would skip everything they point past
+    cursor.execute('DELETE FROM listing_cursors')
+    cursor.execute('DELETE FROM seen_filters')
+    cursor.execute('DELETE FROM backfill_checkpoints')
     
     connection.commit()
     connection.close()
@@ -0,0 +1,184 @@
+import argparse
+from blacklist_loader import load_blacklist_files
+from extraction_memo import ExtractionMemo
+from lexicon import Lexicon
+import random
+import sys
+from ticker_extractor import TickerExtractor
+from ticker_list_controller import load_ticker_list_from_csv
+import time
+
+"""
+checks that TickerExtractor.extract returns exactly what the original regex and
+word-by-word extraction did, then reports how many documents per second each
+of them gets through on a synthetic comment corpus, and what the ExtractionMemo
+saves on one where a share of the comments are repeated copypasta
+
+the corpus is seeded so every run sees the same text...it mixes tickers, share
+class forms written with every separator, regular and random_dc words, blacklisted
+words, possessives, HTML entities and numbers, in upper, lower and title case, to
+exercise every branch of the extraction logic
+
+run from the src folder:
+    python3 extraction_benchmark.py --documents 20000
+"""
+
+# the list based legacy run is slow enough that it only sees this many documents
+LIST_SAMPLE = 200
+
+def legacy_extract(content: str, blacklisted_words, regular_words, random_words_dc,
+                   ticker_list) -> set[str]:
+    '''
+    the extraction logic as it was before the compiled lexicon, kept as the
+    golden reference extract must agree with
+    '''
+    raw_matches = TickerExtractor.PATTERN.findall(content)
+    valid_tickers = set()
+
+    for word in raw_matches:
+        normalised_word = word.replace('.', '/').replace('-', '/')
+        upper_word = normalised_word.upper()
+
+        if upper_word in blacklisted_words:
+            continue
+
+        if upper_word in ticker_list:
+            if upper_word in regular_words or upper_word in random_words_dc:
+                if word.isupper():
+                    valid_tickers.add(upper_word)
+            else:
+                valid_tickers.add(upper_word)
+
+    return valid_tickers
+
+def generate_corpus(document_count: int, words_per_document: int, vocabulary: list[str],
+                    seed: int = 0) -> list[str]:
+    rng = random.Random(seed)
+    casings = [str.upper, str.lower, str.title, lambda word: word]
+    decorations = [
+        "{}", "{}", "{}", "${}", "{}'s", "{}’s", "({})", "{}!", "{},", "{}.", "&amp;{}",
+        "{}&amp;", "{}123", "9{}", "#{}", "**{}**",
+    ]
+
+    corpus = []
+    for _ in range(document_count):
+        words = []
+        for _ in range(words_per_document):
+            word = rng.choice(vocabulary)
+            # share class tickers appear with every separator people actually use
+            if "/" in word:
+                word = word.replace("/", rng.choice("/.-^"))
+            word = rng.choice(casings)(word)
+            words.append(rng.choice(decorations).format(word))
+        corpus.append(" ".join(words))
+
+    return corpus
+
+def generate_repeated_corpus(corpus: list[str], repeated_share: float, seed: int = 0) -> list[str]:
+    '''
+    corpus with repeated_share of its documents replaced by copies of a few
+    dozen of them, the way spam and bot replies repeat in a comment stream
+    '''
+    rng = random.Random(seed)
+    copypasta = corpus[:40]
+
+    return [
+        rng.choice(copypasta) if rng.random() < repeated_share else document
+        for document in corpus
+    ]
+
+def build_vocabulary(blacklisted_words, regular_words, random_words_dc, ticker_list) -> list[str]:
+    rng = random.Random(1)
+    # roughly the make up of a stock subreddit comment, mostly ordinary words with
+    # a sprinkling of tickers
+    return (
+        rng.sample(sorted(regular_words), min(2000, len(regular_words)))
+        + sorted(random_words_dc)
+        + sorted(blacklisted_words)
+        + rng.sample(sorted(ticker_list), min(1500, len(ticker_list)))
+        + [ticker for ticker in ticker_list if "/" in ticker or "^" in ticker]
+        + ["moon", "calls", "puts", "yolo", "tendies", "to", "the", "and", "a", "I"]
+    )
+
+def check_equivalence(extractor: TickerExtractor, corpus: list[str], word_lists) -> int:
+    '''
+    returns the number of documents checked, raising on the first document whose
+    tickers differ from the legacy extraction
+    '''
+    for document in corpus:
+        expected = legacy_extract(document, *word_lists)
+        actual = extractor.extract(document)
+        if actual != expected:
+            raise AssertionError(
+                f"Extraction differs from legacy output.\nDocument: {document}\n"
+                f"Expected: {sorted(expected)}\nActual: {sorted(actual)}"
+            )
+
+    return len(corpus)
+
+def measure(extract, corpus: list[str]) -> float:
+    start = time.perf_counter()
+    for document in corpus:
+        extract(document)
+    elapsed = time.perf_counter() - start
+
+    return len(corpus) / elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description="TickerExtractor equivalence check and benchmark")
+    parser.add_argument("--documents", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeated-share", type=float, default=0.3,
+                        help="share of documents in the memo corpus that are repeats")
+    args = parser.parse_args()
+
+    blacklisted_words, regular_words, random_words_dc = load_blacklist_files()
+    ticker_list = load_ticker_list_from_csv()
+    word_lists = (blacklisted_words, regular_words, random_words_dc, ticker_list)
+
+    extractor = TickerExtractor(Lexicon.build(*word_lists))
+    vocabulary = build_vocabulary(*word_lists)
+
+    corpora = {
+        "short (20 words)": generate_corpus(args.documents, 20, vocabulary, args.seed),
+        "long (500 words)": generate_corpus(max(args.documents // 25, 1), 500, vocabulary, args.seed),
+    }
+
+    # the legacy extraction was handed the sorted lists the loaders used to return,
+    # which made every membership check a linear scan...sets give it identical
+    # output and let the gain from the algorithm itself be measured separately
+    legacy_sets = tuple(set(words) for words in word_lists)
+    legacy_lists = tuple(sorted(words) for words in word_lists)
+
+    try:
+        for name, corpus in corpora.items():
+            checked = check_equivalence(extractor, corpus, legacy_sets)
+            print(f"Equivalence: {checked} {name} documents match the legacy extraction.")
+    except AssertionError as e:
+        print(f"FATAL ERROR: {e}")
+        sys.exit(1)
+
+    for name, corpus in corpora.items():
+        list_rate = measure(
+            lambda document: legacy_extract(document, *legacy_lists), corpus[:LIST_SAMPLE]
+        )
+        set_rate = measure(lambda document: legacy_extract(document, *legacy_sets), corpus)
+        current_rate = measure(extractor.extract, corpus)
+        print(
+            f"{name}: legacy with lists {list_rate:,.0f} docs/s, legacy with sets "
+            f"{set_rate:,.0f} docs/s, current {current_rate:,.0f} docs/s"
+        )
+
+    for name, corpus in corpora.items():
+        repeated = generate_repeated_corpus(corpus, args.repeated_share, args.seed)
+        current_rate = measure(extractor.extract, repeated)
+        # a fresh memo per corpus, so every distinct document is extracted once
+        memo = ExtractionMemo()
+        memo_rate = measure(lambda document: memo.extract(extractor, document), repeated)
+        print(
+            f"{name}, {args.repeated_share:.0%} repeated: current {current_rate:,.0f} docs/s, "
+            f"with memo {memo_rate:,.0f} docs/s at a {memo.hit_rate:.0%} hit rate"
+        )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+from collections import OrderedDict
+from hashlib import blake2b
+
+"""
+remembers the tickers extracted from recently seen text, so the copypasta, bot
+replies and one line spam that make up a large share of a stock subreddit's
+comments are only extracted once
+
+short text, the one liners and bot replies that repeat most, is keyed on the
+string itself, which costs no more than the dictionary lookup...text of
+DIGEST_LENGTH characters or more is keyed by a 16 byte blake2b digest instead, so
+a long copypasta costs the memo 16 bytes however often it repeats...the memo is a
+bounded LRU of MEMO_SIZE entries and clears itself the first time it is handed an
+extractor with a different lexicon version, so a ticker list or blacklist change
+can never be answered from the old lexicon's results
+
+every process has its own memo, parallel_extractor's workers each build one next
+to their extractor, and the process-wide one is handed out by get_extraction_memo
+"""
+
+# about 250 bytes an entry, up to twice that for text that is its own key, most
+# results being the shared empty set
+MEMO_SIZE = 20000
+# shorter text is its own key, longer text is digested so the memo's size is
+# bounded by MEMO_SIZE rather than by what the entries happen to hold
+DIGEST_LENGTH = 256
+
+_NO_TICKERS = frozenset()
+_extraction_memo = None
+
+class ExtractionMemo:
+    """
+    not thread safe, extraction runs in the one thread consuming the scrapers'
+    items (see parallel_extractor.py), and every worker process has its own
+    """
+    def __init__(self, max_size: int = MEMO_SIZE):
+        self.__max_size = max_size
+        self.__entries = OrderedDict()
+        self.__version = None
+        self.__version_key = b""
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def extract(self, ticker_extractor, content: str) -> frozenset[str]:
+        '''
+        the tickers ticker_extractor finds in content, extracting only if this
+        text was not seen with the same lexicon recently
+        '''
+        if ticker_extractor.version != self.__version:
+            self.__switch_version(ticker_extractor.version)
+
+        # digests are bytes, so they can never collide with a text key
+        key = content if len(content) < DIGEST_LENGTH else (
+            blake2b(content.encode(), digest_size=16, key=self.__version_key).digest()
+        )
+        entries = self.__entries
+
+        tickers = entries.get(key)
+        if tickers is not None:
+            entries.move_to_end(key)
+            self.hits += 1
+            return tickers
+
+        self.misses += 1
+        tickers = entries[key] = frozenset(ticker_extractor.extract(content)) or _NO_TICKERS
+        if len(entries) > self.__max_size:
+            entries.popitem(last=False)
+            self.evictions += 1
+
+        return tickers
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self.__entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+    def __switch_version(self, version: str):
+        if self.__version is not None:
+            self.invalidations += 1
+        self.__entries.clear()
+        self.__version = version
+        # blake2b keys are at most 64 bytes, lexicon versions may be any string
+        self.__version_key = blake2b(version.encode(), digest_size=32).digest()
+
+def get_extraction_memo() -> ExtractionMemo:
+    global _extraction_memo
+
+    if _extraction_memo is None:
+        _extraction_memo = ExtractionMemo()
+
+    return _extraction_memo
@@ -0,0 +1,175 @@
+from collections import deque
+import metrics
+from rate_limiter import RETRY_STATUSES, RateLimiter
+import requests
+from requests.adapters import HTTPAdapter
+import threading
+import time
+from urllib.parse import urlparse
+
+"""
+provides a single, process-wide requests Session that every fetcher in the project
+uses, so connections to Reddit and Nasdaq are pooled and kept alive between calls
+rather than paying for a fresh TCP and TLS handshake on every post and comment page
+
+each host we talk to gets its own adapter with a pool sized for how many requests
+we may have in flight against it at once, anything else falls back to a default
+adapter...connection reuse is tracked per host using urllib3's own pool counters
+
+callers of a rate limited API pass their shared RateLimiter to get(), which paces
+the requests and retries throttled or failed ones (see rate_limiter.py)
+"""
+
+# number of connections kept alive per host, Reddit is hit concurrently by the
+# scraper so it gets the largest pool
+HOST_POOL_SIZES = {
+    "www.reddit.com": 8,
+    "api.nasdaq.com": 1,
+}
+DEFAULT_POOL_SIZE = 4
+# how many recent request durations are kept per host for latency percentiles
+DURATION_HISTORY = 10000
+
+# requests already negotiates compression by default, stated explicitly here so the
+# session keeps asking for it regardless of what headers individual callers pass
+DEFAULT_HEADERS = {
+    "Accept-Encoding": "gzip, deflate",
+    "Connection": "keep-alive",
+}
+
+_session = None
+_session_lock = threading.Lock()
+_request_counts = {}
+_request_durations = {}
+_request_counts_lock = threading.Lock()
+
+def _build_session() -> requests.Session:
+    session = requests.Session()
+    session.headers.update(DEFAULT_HEADERS)
+
+    default_adapter = HTTPAdapter(pool_connections=len(HOST_POOL_SIZES) + 1,
+                                  pool_maxsize=DEFAULT_POOL_SIZE)
+    session.mount("https://", default_adapter)
+    session.mount("http://", default_adapter)
+
+    # requests picks the adapter with the longest matching prefix, so these take
+    # precedence over the defaults above for their hosts
+    for host, pool_size in HOST_POOL_SIZES.items():
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        session.mount(f"https://{host}", adapter)
+        session.mount(f"http://{host}", adapter)
+
+    return session
+
+def get_session() -> requests.Session:
+    global _session
+
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _build_session()
+
+    return _session
+
+def _send(url: str, host: str, **kwargs) -> requests.Response:
+    with _request_counts_lock:
+        _request_counts[host] = _request_counts.get(host, 0) + 1
+
+    start = time.perf_counter()
+    try:
+        return get_session().get(url, **kwargs)
+
+    finally:
+        duration = time.perf_counter() - start
+        with _request_counts_lock:
+            if host not in _request_durations:
+                _request_durations[host] = deque(maxlen=DURATION_HISTORY)
+            _request_durations[host].append(duration)
+
+def get(url: str, rate_limiter: RateLimiter = None, **kwargs) -> requests.Response:
+    '''
+    with a rate_limiter, waits for its go ahead before every attempt and retries
+    429 and 5xx responses up to its max_retries, the last response is returned
+    either way so the caller's raise_for_status still sees a persistent failure
+    '''
+    host = urlparse(url).netloc
+    if rate_limiter is None:
+        return _send(url, host, **kwargs)
+
+    attempt = 0
+    while True:
+        waited = rate_limiter.acquire()
+        if waited:
+            metrics.record("rate_limit_wait", waited, host=host)
+
+        try:
+            response = _send(url, host, **kwargs)
+        except BaseException:
+            rate_limiter.release()
+            raise
+        rate_limiter.release(response.status_code, response.headers)
+
+        if response.status_code not in RETRY_STATUSES or attempt >= rate_limiter.max_retries:
+            return response
+
+        delay = rate_limiter.backoff(attempt)
+        print(
+            f"NON-FATAL ERROR: {host} answered {response.status_code}, retrying in "
+            f"{delay:.1f}s ({attempt + 1}/{rate_limiter.max_retries})"
+        )
+        metrics.record("backoff", delay, errors=1, host=host, status=response.status_code)
+        response.close()
+        time.sleep(delay)
+        attempt += 1
+
+def get_request_durations() -> dict[str, list[float]]:
+    '''
+    returns the most recent request durations, in seconds, per host
+    '''
+    with _request_counts_lock:
+        return {host: list(durations) for host, durations in _request_durations.items()}
+
+def get_connection_stats() -> dict[str, dict[str, int]]:
+    '''
+    returns, per host, how many requests were made, how many new connections had
+    to be opened for them and therefore how many reused an existing connection
+    '''
+    opened_connections = {}
+
+    if _session is not None:
+        for adapter in set(_session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                # matches the netloc we keyed request counts by, which only
+                # carries the port when it isn't the scheme's default
+                host = pool.host if pool.port in (None, 80, 443) else f"{pool.host}:{pool.port}"
+                opened_connections[host] = opened_connections.get(host, 0) + pool.num_connections
+
+    with _request_counts_lock:
+        request_counts = dict(_request_counts)
+
+    stats = {}
+    for host, requests_made in request_counts.items():
+        connections = opened_connections.get(host, 0)
+        stats[host] = {
+            "requests": requests_made,
+            "connections": connections,
+            "reused": max(requests_made - connections, 0),
+        }
+
+    return stats
+
+def close_session():
+    global _session
+
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+    with _request_counts_lock:
+        _request_counts.clear()
+        _request_durations.clear()
@@ -0,0 +1,175 @@
+from blacklist_loader import BLACKLISTS_DIR, load_blacklist_files
+import hashlib
+from itertools import product
+import pickle
+from ticker_list_controller import TICKER_LIST_FILE, TICKERS_PATH, load_ticker_list_from_csv
+
+"""
+compiles the blacklists and the ticker list into a single lookup table, mapping every
+normalised surface form a ticker or blacklisted word can take to the ticker it stands
+for and a small classification code, so ticker extraction needs exactly one hash
+lookup per candidate word
+
+share class tickers are stored under every separator people write them with, so
+"BRK.A", "BRK-A" and "BRK/A" all resolve to the ticker list's own "BRK/A"
+
+building the table means parsing ~13,000 lines across the source files, so the
+compiled lexicon is also saved to LEXICON_FILE together with a hash of those
+sources, and reused on later runs for as long as none of them have changed
+"""
+
+LEXICON_FILE = TICKERS_PATH / "lexicon.pickle"
+# bumped whenever the layout of the saved lexicon changes, so stale files are rebuilt
+LEXICON_FORMAT = 1
+
+# the separators a share class may be written with, "/" is the one our ticker
+# list uses
+SHARE_CLASS_SEPARATORS = "/.-"
+
+class Lexicon:
+    # classification codes
+    # always filtered out, regardless of case
+    BLACKLISTED = 0
+    # counted in any case
+    TICKER = 1
+    # regular or random_dc words that are also tickers, only counted when written
+    # fully uppercase
+    CASE_SENSITIVE_TICKER = 2
+
+    def __init__(self, entries: dict[str, tuple[str, int]], version: str):
+        self.__entries = entries
+        self.__version = version
+
+    @property
+    def entries(self) -> dict[str, tuple[str, int]]:
+        '''
+        uppercase surface form -> (ticker, code), forms that are neither a ticker
+        nor blacklisted are absent...read directly by TickerExtractor's hot loop
+        '''
+        return self.__entries
+
+    @property
+    def version(self) -> str:
+        return self.__version
+
+    @classmethod
+    def build(cls, blacklisted_words, regular_words, random_words_dc, ticker_list,
+              version: str = "") -> "Lexicon":
+        case_sensitive_words = set(regular_words) | set(random_words_dc)
+        entries = {}
+
+        for ticker in ticker_list:
+            # a ticker spelt with anything but "/" could never be matched in its
+            # normalised form
+            if "." in ticker or "-" in ticker:
+                continue
+
+            code = cls.CASE_SENSITIVE_TICKER if ticker in case_sensitive_words else cls.TICKER
+            for form in share_class_aliases(ticker):
+                entries[form] = (ticker, code)
+
+        # blacklisted words always win, even over a ticker with the same symbol
+        for word in blacklisted_words:
+            for form in share_class_aliases(word):
+                entries[form] = (word, cls.BLACKLISTED)
+
+        return cls(entries, version)
+
+    def save(self, path=None):
+        path = path or LEXICON_FILE
+
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # written under a temporary name first so a concurrent reader never
+            # loads a half written file
+            temp_path = path.with_suffix(".tmp")
+            with open(temp_path, "wb") as lexicon_file:
+                pickle.dump(
+                    (LEXICON_FORMAT, self.__version, self.__entries), lexicon_file,
+                    protocol=pickle.HIGHEST_PROTOCOL
+                )
+            temp_path.replace(path)
+
+        except Exception as e:
+            # a missing artifact only costs a rebuild next run
+            print(f"NON-FATAL ERROR: Could not save compiled lexicon: {e}")
+
+    @classmethod
+    def load(cls, path=None):
+        '''
+        returns the saved lexicon, or None if there is no usable one on disk
+        '''
+        path = path or LEXICON_FILE
+
+        try:
+            with open(path, "rb") as lexicon_file:
+                lexicon_format, version, entries = pickle.load(lexicon_file)
+
+        except FileNotFoundError:
+            return None
+
+        except Exception as e:
+            print(f"NON-FATAL ERROR: Could not load compiled lexicon, rebuilding it: {e}")
+            return None
+
+        if lexicon_format != LEXICON_FORMAT:
+            return None
+
+        return cls(entries, version)
+
+def share_class_aliases(symbol: str) -> list[str]:
+    parts = symbol.split("/")
+
+    return [
+        parts[0] + "".join(separator + part for separator, part in zip(separators, parts[1:]))
+        for separators in product(SHARE_CLASS_SEPARATORS, repeat=len(parts) - 1)
+    ]
+
+def get_source_fingerprint() -> tuple:
+    '''
+    a cheap stat-only summary of the source files, if it is unchanged the lexicon
+    is too, if it changed the content hash decides
+    '''
+    fingerprint = []
+    for source_file in get_source_files():
+        stat = source_file.stat()
+        fingerprint.append((source_file.name, stat.st_mtime_ns, stat.st_size))
+
+    return tuple(fingerprint)
+
+def get_source_files() -> list:
+    return sorted(BLACKLISTS_DIR.glob("*.txt")) + [TICKER_LIST_FILE]
+
+def hash_sources() -> str:
+    source_hash = hashlib.sha256()
+    for source_file in get_source_files():
+        source_hash.update(source_file.name.encode())
+        source_hash.update(source_file.read_bytes())
+
+    return source_hash.hexdigest()[:16]
+
+def load_lexicon(version: str = None) -> Lexicon:
+    '''
+    returns the compiled lexicon for the current blacklists and ticker list, loading
+    the saved one when its sources are unchanged and rebuilding (and saving) it
+    otherwise, version can be passed in when the caller already hashed the sources
+    '''
+    if version is None:
+        version = hash_sources()
+
+    lexicon = Lexicon.load()
+    if lexicon is not None and lexicon.version == version:
+        return lexicon
+
+    blacklisted_words, regular_words, random_words_dc = load_blacklist_files()
+    ticker_list = load_ticker_list_from_csv()
+
+    lexicon = Lexicon.build(blacklisted_words, regular_words, random_words_dc, ticker_list, version)
+    lexicon.save()
+    print(f"Compiled lexicon version {version} with {len(lexicon.entries)} entries.")
+
+    return lexicon
+
+if __name__ == "__main__":
+    lexicon = load_lexicon()
+    print(f"Lexicon version {lexicon.version}: {len(lexicon.entries)} entries")
@@ -1,12 +1,19 @@
 from apscheduler.schedulers.blocking import BlockingScheduler
 from apscheduler.events import EVENT_JOB_ERROR
-from blacklist_loader import load_blacklist_files
+from concurrent_scraper import scrape_subreddits_concurrently
 from datetime import datetime, time
-from db_config import initialise_db
+from db_config import close_connections, initialise_db
+from extraction_memo import get_extraction_memo
+import http_client
+from mention_writer import close_mention_writer, get_mention_writer
+import metrics
 import os
+from parallel_extractor import extract_items
+from pathlib import Path
 from scraper import Scraper
-from ticker_extractor import TickerExtractor
-from ticker_list_controller import fetch_ticker_list, load_ticker_list_from_csv
+from seen_window import get_seen_window, reset_seen_window
+from ticker_extractor import get_ticker_extractor
+from ticker_list_controller import fetch_ticker_list
 
 POSTS_TO_COLLECT = 5
 COMMENTS_TO_COLLECT = 10
@@ -16,38 +23,121 @@ SUBREDDITS = [
 ]
 SCRAPER_EXTRACTOR_DELAY = 30    # minute(s)
 TICKER_LIST_UPDATER_DELAY = 1   # day(s)
+# when enabled, every subreddit listing and comment page is fetched in parallel,
+# MAX_CONCURRENT_REQUESTS caps the whole run and MAX_REQUESTS_PER_HOST caps how
+# many of those may be in flight against a single host at once
+CONCURRENT_SCRAPE = True
+MAX_CONCURRENT_REQUESTS = 8
+MAX_REQUESTS_PER_HOST = 4
+# when enabled, comments are read from each subreddit's newest comments listing
+# (one or two requests per subreddit, every new comment on any post) instead of
+# fetching the comment page of each of the POSTS_TO_COLLECT newest posts
+COMMENT_STREAM = False
+# morechildren requests allowed per post to resolve the comments Reddit truncates
+# behind "more" objects (up to 100 comments per request), 0 disables expansion...
+# every request counts towards the rate limit, see README
+MORE_COMMENTS_BUDGET = 0
+# runs that produce at least this many posts/comments have their extraction spread
+# over EXTRACTION_WORKERS processes (None means one per core), smaller runs, which
+# is every normal 30 minute scrape, extract inline
+PARALLEL_EXTRACTION_THRESHOLD = 5000
+EXTRACTION_WORKERS = None
+# per-stage timings, counts, bytes and errors are written to METRICS_FILE after
+# every scrape in the Prometheus text format (point node_exporter's textfile
+# collector at its folder), set METRICS_PORT to also serve them on
+# http://127.0.0.1:<port>/metrics
+METRICS_FILE = Path(__file__).resolve().parent.parent / "metrics" / "reddit_tracker.prom"
+METRICS_PORT = None
 
 def boot_sequence():
     initialise_db()
-    global BLACKLISTED_WORDS, REGULAR_WORDS, RANDOM_WORDS_DC
-    BLACKLISTED_WORDS, REGULAR_WORDS, RANDOM_WORDS_DC = load_blacklist_files()
+    # loads the sliding window caches into memory
+    get_seen_window()
 
 def update_ticker_list():
     print(f"[{datetime.now()}] Updating ticker list...")
     fetch_ticker_list()
+    # builds the new extractor here rather than at the start of the next scrape
+    ticker_extractor = get_ticker_extractor()
+    print(f"[{datetime.now()}] Active lexicon version: {ticker_extractor.version}")
 
 def execute_scrape():
     print(f"[{datetime.now()}] Starting scrape of {SUBREDDITS}...")
+    metrics.start_run()
     
-    ticker_list = load_ticker_list_from_csv()
-    ticker_extractor = TickerExtractor(BLACKLISTED_WORDS, REGULAR_WORDS, RANDOM_WORDS_DC, ticker_list)
-    ticker_count = 0
+    # held for the whole run, a reload mid-scrape only affects the next one
+    ticker_extractor = get_ticker_extractor()
+    print(f"[{datetime.now()}] Using lexicon version {ticker_extractor.version}")
+    mention_writer = get_mention_writer()
+    item_count = 0
     
-    for subreddit in SUBREDDITS:
-        scraper = Scraper(subreddit, POSTS_TO_COLLECT, COMMENTS_TO_COLLECT)
-        sub_data = scraper.scrape_data()
-        for post_or_comment in sub_data:
-            tickers = ticker_extractor.extract(post_or_comment.text)
-            # print(
-            #     tickers, post_or_comment.post_id, post_or_comment.comment_id, 
-            #     post_or_comment.subreddit, post_or_comment.timestamp
-            # )
-            
-            if tickers:
-                ticker_count += len(tickers)
-                ticker_extractor.record_mentions(post_or_comment, tickers)
-
-    print(f"[{datetime.now()}] Successfully recorded {ticker_count} mentions.")
+    scrapers = [
+        Scraper(
+            subreddit, POSTS_TO_COLLECT, COMMENTS_TO_COLLECT, COMMENT_STREAM,
+            MORE_COMMENTS_BUDGET
+        )
+        for subreddit in SUBREDDITS
+    ]
+    if CONCURRENT_SCRAPE:
+        scraped_items = scrape_subreddits_concurrently(
+            scrapers, MAX_CONCURRENT_REQUESTS, MAX_REQUESTS_PER_HOST
+        )
+    else:
+        scraped_items = (item for scraper in scrapers for item in scraper.scrape_data())
+    
+    try:
+        try:
+            extraction_results = extract_items(
+                ticker_extractor, scraped_items, EXTRACTION_WORKERS, PARALLEL_EXTRACTION_THRESHOLD
+            )
+            for post_or_comment, tickers in extraction_results:
+                item_count += 1
+                # print(
+                #     tickers, post_or_comment.post_id, post_or_comment.comment_id, 
+                #     post_or_comment.subreddit, post_or_comment.timestamp
+                # )
+                
+                # committed in batches by the writer thread while scraping goes on
+                if tickers:
+                    mention_writer.put(post_or_comment, tickers)
+        
+        finally:
+            # whatever was extracted before a failure is still written
+            inserted, ignored = mention_writer.flush()
+    
+    except Exception:
+        # some of this run's mentions may not have been recorded, so none of its
+        # items may stay marked as seen, the next run reloads the window from the
+        # database and INSERT OR IGNORE skips the mentions that did make it
+        reset_seen_window()
+        raise
+    
+    # the run's items only count as seen in the database once their mentions are in
+    with metrics.timed("checkpoint") as timer:
+        timer.items = get_seen_window().checkpoint()
+    print(f"[{datetime.now()}] Successfully recorded {inserted} mentions.")
+    if ignored:
+        # check README, section Post Reprocessing Issue, for explanation
+        print(
+            f"[{datetime.now()}] INFO: Ignored {ignored} previously recorded "
+            "mentions returned by the scraper."
+        )
+    for host, stats in http_client.get_connection_stats().items():
+        print(
+            f"[{datetime.now()}] {host}: {stats['requests']} requests since start over "
+            f"{stats['connections']} connections ({stats['reused']} reused)"
+        )
+    memo_stats = get_extraction_memo().stats()
+    print(
+        f"[{datetime.now()}] Extraction memo: {memo_stats['hit_rate']:.0%} of "
+        f"{memo_stats['hits'] + memo_stats['misses']} texts since start were repeats, "
+        f"{memo_stats['size']} remembered"
+    )
+    for line in metrics.format_run_summary():
+        print(f"[{datetime.now()}] {line}")
+    metrics.write_prometheus(METRICS_FILE)
+    
+    return {"items": item_count, "inserted": inserted, "ignored": ignored}
     
 def crash_on_error(event):
     '''
@@ -59,6 +149,12 @@ def crash_on_error(event):
         print(f"\n[{datetime.now()}] JOB FATAL ERROR: {event.job_id}")
         print(event.traceback)
         
+        # os._exit skips the writer thread's own shutdown
+        try:
+            close_mention_writer()
+        except Exception as e:
+            print(f"NON-FATAL ERROR: Failed to flush queued mentions: {e}")
+        
         os._exit(1)
 
 def start_scheduler():
@@ -66,6 +162,9 @@ def start_scheduler():
     
     scheduler.add_listener(crash_on_error, EVENT_JOB_ERROR)
     
+    if METRICS_PORT:
+        metrics.start_metrics_server(METRICS_PORT)
+    
     # run immediately on start to ensure ticker list is available before scraper
     # ever starts
     update_ticker_list()
@@ -93,6 +192,9 @@ def start_scheduler():
     except (KeyboardInterrupt, SystemExit):
         print("\nShutting down...")
         scheduler.shutdown()
+        close_mention_writer()
+        close_connections()
+        http_client.close_session()
         
     except Exception as e:
         print(f"Unexpected error: {e}. Shutting down...")
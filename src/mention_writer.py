@@ -0,0 +1,149 @@
+import metrics
+import queue
+import threading
+from ticker_extractor import record_mentions
+import time
+
+"""
+writes mentions behind the scrape, execute_scrape puts every item with tickers
+on a bounded queue as soon as it's extracted and a dedicated writer thread
+commits them in batches, so the network never waits on the disk and the disk
+never waits on the network...that relies on extract_items yielding every item as
+it's fetched rather than once the run is over (see parallel_extractor.py)
+
+a batch is written once it holds BATCH_SIZE items or its oldest item has waited
+FLUSH_INTERVAL seconds, in one transaction through record_mentions...when the
+queue holds QUEUE_SIZE items put blocks until the writer catches up, the time
+spent waiting is recorded as the write_backpressure stage
+
+flush blocks until everything put so far is committed and returns what was
+inserted and ignored since the last flush, execute_scrape calls it before the
+seen window is checkpointed, whether the scrape succeeded or not...a failed
+write is raised from the next put or flush, the items queued behind it are
+dropped (the window is reset, so the next scrape sees them again) and the
+writer carries on fresh after that flush
+
+the writer thread lives as long as the process, so its database connection is
+opened once...close_mention_writer flushes and stops it on shutdown
+"""
+
+# items, not mentions, per transaction
+BATCH_SIZE = 500
+FLUSH_INTERVAL = 2.0  # seconds
+QUEUE_SIZE = 5000
+
+_STOP = object()
+_mention_writer = None
+_writer_lock = threading.Lock()
+
+class MentionWriter:
+    def __init__(self, batch_size: int = BATCH_SIZE, flush_interval: float = FLUSH_INTERVAL,
+                 queue_size: int = QUEUE_SIZE):
+        self.__batch_size = batch_size
+        self.__flush_interval = flush_interval
+        self.__queue = queue.Queue(maxsize=queue_size)
+        # since the last flush, only touched by the writer thread until a flush
+        # marker has been handed back
+        self.__inserted = 0
+        self.__ignored = 0
+        self.__error = None
+        self.__thread = threading.Thread(target=self.__run, name="mention-writer", daemon=True)
+        self.__thread.start()
+
+    def put(self, item, tickers):
+        if self.__error is not None:
+            raise self.__error
+
+        try:
+            self.__queue.put_nowait((item, tickers))
+        except queue.Full:
+            with metrics.timed("write_backpressure") as timer:
+                self.__queue.put((item, tickers))
+                timer.items = 1
+
+    def flush(self) -> tuple[int, int]:
+        '''
+        blocks until every item put so far is committed, returns the number of
+        mentions inserted and ignored since the last flush
+        '''
+        flushed = threading.Event()
+        self.__queue.put(flushed)
+        flushed.wait()
+
+        inserted, ignored, error = self.__inserted, self.__ignored, self.__error
+        self.__inserted = self.__ignored = 0
+        self.__error = None
+        if error is not None:
+            raise error
+
+        return inserted, ignored
+
+    def close(self):
+        '''
+        commits what's left and stops the writer thread
+        '''
+        self.__queue.put(_STOP)
+        self.__thread.join()
+        if self.__error is not None:
+            raise self.__error
+
+    def __write(self, batch: list):
+        if not batch:
+            return
+
+        # after a failure nothing more is written until the caller has seen it
+        if self.__error is None:
+            try:
+                inserted, ignored = record_mentions(batch)
+                self.__inserted += inserted
+                self.__ignored += ignored
+            except Exception as e:
+                # record_mentions already printed and rolled back
+                self.__error = e
+        batch.clear()
+
+    def __run(self):
+        batch = []
+        deadline = None
+
+        while True:
+            timeout = None if not batch else max(deadline - time.monotonic(), 0.0)
+            try:
+                entry = self.__queue.get(timeout=timeout)
+            except queue.Empty:
+                # the oldest item in the batch has waited long enough
+                self.__write(batch)
+                continue
+
+            if entry is _STOP:
+                self.__write(batch)
+                return
+
+            if isinstance(entry, threading.Event):
+                self.__write(batch)
+                entry.set()
+                continue
+
+            batch.append(entry)
+            if len(batch) == 1:
+                deadline = time.monotonic() + self.__flush_interval
+            if len(batch) >= self.__batch_size:
+                self.__write(batch)
+
+def get_mention_writer() -> MentionWriter:
+    global _mention_writer
+
+    with _writer_lock:
+        if _mention_writer is None:
+            _mention_writer = MentionWriter()
+
+    return _mention_writer
+
+def close_mention_writer():
+    global _mention_writer
+
+    with _writer_lock:
+        writer, _mention_writer = _mention_writer, None
+
+    if writer is not None:
+        writer.close()
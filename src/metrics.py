@@ -0,0 +1,215 @@
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+import threading
+import time
+
+"""
+in-process instrumentation of the pipeline stages, every stage records how long
+it took, how many items and bytes it handled and whether it failed, keyed by the
+stage name and a few labels (e.g. the subreddit or endpoint)
+
+recording is a dictionary update under a lock, cheap enough to wrap every fetch,
+cache check and write...hot per-item work like cleaning and extraction is timed
+by the caller across a whole listing or batch and recorded once
+
+the totals since start can be written out in the Prometheus text format, to a
+file for node_exporter's textfile collector or served on a local port, and the
+stages of a single scrape can be summarised with start_run/format_run_summary
+"""
+
+METRIC_PREFIX = "reddit_tracker"
+
+# per (stage, labels): [calls, seconds, max_seconds, items, bytes, errors]
+_CALLS, _SECONDS, _MAX_SECONDS, _ITEMS, _BYTES, _ERRORS = range(6)
+
+_totals = {}
+_run = {}
+_run_started = None
+_lock = threading.Lock()
+
+class StageTimer:
+    '''
+    handed out by timed(), the caller fills in items and bytes as it learns them
+    '''
+    __slots__ = ("items", "bytes")
+
+    def __init__(self):
+        self.items = 0
+        self.bytes = 0
+
+def record(stage: str, seconds: float = 0.0, items: int = 0, bytes: int = 0,
+           errors: int = 0, **labels):
+    key = (stage, tuple(sorted(labels.items())))
+
+    with _lock:
+        for stats in (_totals, _run):
+            values = stats.get(key)
+            if values is None:
+                values = stats[key] = [0, 0.0, 0.0, 0, 0, 0]
+            values[_CALLS] += 1
+            values[_SECONDS] += seconds
+            values[_MAX_SECONDS] = max(values[_MAX_SECONDS], seconds)
+            values[_ITEMS] += items
+            values[_BYTES] += bytes
+            values[_ERRORS] += errors
+
+@contextmanager
+def timed(stage: str, **labels):
+    '''
+    records the duration of the with block as one call of stage, counting it as
+    an error if the block raised (the exception still propagates)
+    '''
+    timer = StageTimer()
+    start = time.perf_counter()
+    errors = 0
+
+    try:
+        yield timer
+    except BaseException:
+        errors = 1
+        raise
+    finally:
+        record(stage, time.perf_counter() - start, timer.items, timer.bytes, errors, **labels)
+
+def start_run():
+    '''
+    clears the per-run stats, the totals since start are kept
+    '''
+    global _run_started
+
+    with _lock:
+        _run.clear()
+        _run_started = time.perf_counter()
+
+def run_summary() -> dict[str, dict]:
+    '''
+    the current run's stats per stage, summed over labels
+    '''
+    with _lock:
+        summary = {}
+        for (stage, _), values in _run.items():
+            stage_summary = summary.setdefault(
+                stage, {"calls": 0, "seconds": 0.0, "items": 0, "bytes": 0, "errors": 0}
+            )
+            stage_summary["calls"] += values[_CALLS]
+            stage_summary["seconds"] += values[_SECONDS]
+            stage_summary["items"] += values[_ITEMS]
+            stage_summary["bytes"] += values[_BYTES]
+            stage_summary["errors"] += values[_ERRORS]
+
+        return summary
+
+def format_run_summary() -> list[str]:
+    '''
+    one line per stage, slowest first...stages may overlap (fetches run
+    concurrently, extraction is interleaved with fetching), so their share of
+    the run's wall time can add up to more than 100%
+    '''
+    elapsed = time.perf_counter() - _run_started if _run_started else 0.0
+    lines = [f"Run took {elapsed:.2f}s:"]
+
+    summary = sorted(run_summary().items(), key=lambda stage: stage[1]["seconds"], reverse=True)
+    for stage, stats in summary:
+        share = stats["seconds"] / elapsed if elapsed else 0.0
+        line = (
+            f"  {stage}: {stats['seconds']:.3f}s ({share:.0%}) over {stats['calls']} calls, "
+            f"{stats['items']} items"
+        )
+        if stats["bytes"]:
+            line += f", {stats['bytes'] / 1024:,.1f} KiB"
+        if stats["errors"]:
+            line += f", {stats['errors']} errors"
+        lines.append(line)
+
+    return lines
+
+def _format_labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+
+    # backslashes, quotes and newlines are the only characters the format escapes
+    def escape(value) -> str:
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+    return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in labels) + "}"
+
+def render_prometheus() -> str:
+    with _lock:
+        snapshot = {key: list(values) for key, values in _totals.items()}
+
+    metrics = [
+        ("stage_seconds", "summary", "Time spent in each pipeline stage.", None),
+        ("stage_max_seconds", "gauge", "Slowest single call of each pipeline stage.", _MAX_SECONDS),
+        ("stage_items_total", "counter", "Items handled by each pipeline stage.", _ITEMS),
+        ("stage_bytes_total", "counter", "Bytes handled by each pipeline stage.", _BYTES),
+        ("stage_errors_total", "counter", "Failed calls of each pipeline stage.", _ERRORS),
+    ]
+
+    lines = []
+    for name, metric_type, help_text, index in metrics:
+        full_name = f"{METRIC_PREFIX}_{name}"
+        lines.append(f"# HELP {full_name} {help_text}")
+        lines.append(f"# TYPE {full_name} {metric_type}")
+
+        for (stage, labels), values in sorted(snapshot.items()):
+            label_text = _format_labels((("stage", stage),) + labels)
+            if index is None:
+                lines.append(f"{full_name}_count{label_text} {values[_CALLS]}")
+                lines.append(f"{full_name}_sum{label_text} {values[_SECONDS]:.6f}")
+            else:
+                value = values[index]
+                lines.append(f"{full_name}{label_text} {value:.6f}" if isinstance(value, float)
+                             else f"{full_name}{label_text} {value}")
+
+    return "\n".join(lines) + "\n"
+
+def write_prometheus(path: Path):
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # the textfile collector may read at any moment, so never let it see a
+        # half written file
+        temp_path = path.with_suffix(".tmp")
+        temp_path.write_text(render_prometheus())
+        temp_path.replace(path)
+
+    except Exception as e:
+        # metrics are never worth failing a scrape over
+        print(f"NON-FATAL ERROR: Could not write metrics to {path}: {e}")
+
+def start_metrics_server(port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    '''
+    serves render_prometheus() at /metrics on a background thread
+    '''
+    class MetricsHandler(BaseHTTPRequestHandler):
+        # scrapes are small responses, don't let them wait out Nagle's algorithm
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            if self.path != "/metrics":
+                self.send_error(404)
+                return
+
+            body = render_prometheus().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return server
+
+def reset():
+    global _run_started
+
+    with _lock:
+        _totals.clear()
+        _run.clear()
+        _run_started = None
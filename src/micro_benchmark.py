@@ -0,0 +1,353 @@
+import argparse
+from blacklist_loader import load_blacklist_files
+import contextlib
+import db_config
+from db_queries import get_mentions_by_ticker, get_tickers_by_mention_count
+from extraction_benchmark import build_vocabulary, generate_corpus
+from itertools import accumulate
+import io
+import json
+from lexicon import Lexicon
+from main import SUBREDDITS
+from pathlib import Path
+import platform
+import random
+from scraper import ScrapedItem, Scraper
+from seen_window import get_seen_window
+import sqlite3
+import sys
+import tempfile
+from ticker_extractor import TickerExtractor, record_mentions
+from ticker_list_controller import load_ticker_list_from_csv
+import time
+
+"""
+times the project's hot functions in isolation, extraction, mention recording,
+the sliding window cache checks and both dashboard queries, against a synthetic
+mentions database of a chosen size, and compares the results with a saved baseline
+
+the synthetic database is generated once per size and seed and reused afterwards
+(50m rows take a while to build)...ticker popularity follows a Zipf distribution,
+as it does on Reddit where a handful of tickers take most of the mentions, and
+mentions are spread evenly over the last SPAN_DAYS days so every dashboard
+timeframe has data...writes made by the benchmarks are removed again afterwards
+
+results are written as JSON, with --baseline a previous result file is compared
+against and the run fails if any benchmark got slower than --tolerance allows
+
+run from the src folder:
+    python3 micro_benchmark.py --size 1m --save baseline.json
+    python3 micro_benchmark.py --size 1m --baseline baseline.json
+"""
+
+SIZES = {"10k": 10_000, "1m": 1_000_000, "50m": 50_000_000}
+# exponent of the ticker popularity distribution, ~1 is typical of word frequencies
+ZIPF_EXPONENT = 1.1
+# how far back the synthetic mentions go, more than the dashboard's longest timeframe
+SPAN_DAYS = 400
+# every post in the synthetic data has this many mentions, one of them on the post
+# itself and the rest on its comments
+MENTIONS_PER_POST = 40
+GENERATE_BATCH = 100_000
+# the dashboard's timeframes (see dashboard_ui.new_timeframe_selected), in seconds
+TIMEFRAMES = {
+    "last_hour": 3600, "last_24_hours": 86400, "last_7_days": 7 * 86400,
+    "last_month": 31 * 86400, "last_year": 365 * 86400, "all_time": None,
+}
+# popularity ranks whose tickers get_mentions_by_ticker is timed for
+HOT_TICKER_RANKS = [1, 10, 100]
+# writes made by the benchmarks use ids starting with this, so they can be removed
+BENCH_PREFIX = "bench_"
+BENCH_SUBREDDIT = "bench_subreddit"
+DATA_DIR = Path(tempfile.gettempdir()) / "reddit_stock_tracker_benchmarks"
+# slowdowns smaller than this many seconds are timer noise, never a regression
+NOISE_FLOOR = 0.00005
+
+def ranked_tickers(ticker_list, seed: int) -> list[str]:
+    '''
+    the ticker list in (seeded) popularity order, most mentioned first
+    '''
+    tickers = sorted(ticker_list)
+    random.Random(seed).shuffle(tickers)
+
+    return tickers
+
+def generate_mention_db(path: Path, rows: int, tickers: list[str], seed: int = 0):
+    '''
+    writes rows synthetic mentions, with Zipf distributed tickers, into a new
+    database at path, built through initialise_db so the schema, indexes and
+    rollups are exactly those of the real database
+    '''
+    temp_path = path.with_suffix(".tmp")
+    temp_path.unlink(missing_ok=True)
+    db_config.DB_PATH = temp_path
+    db_config.initialise_db()
+
+    rng = random.Random(seed)
+    cum_weights = list(accumulate(1 / rank ** ZIPF_EXPONENT for rank in range(1, len(tickers) + 1)))
+    subreddit_weights = list(accumulate(1 / rank for rank in range(1, len(SUBREDDITS) + 1)))
+    newest = time.time()
+    oldest = newest - SPAN_DAYS * 86400
+    step = (newest - oldest) / rows
+
+    connection = sqlite3.connect(temp_path)
+    try:
+        # the rollup triggers would cost an upsert per row, it is far quicker to
+        # load without them and build the rollups in one pass at the end
+        rollup_triggers = [
+            statement for statement in db_config.MIGRATIONS[2]
+            if statement.lstrip().startswith("CREATE TRIGGER")
+        ]
+        connection.execute("DROP TRIGGER mentions_rollup_insert")
+        connection.execute("DROP TRIGGER mentions_rollup_delete")
+
+        started = time.monotonic()
+        for batch_start in range(0, rows, GENERATE_BATCH):
+            batch = []
+            for index in range(batch_start, min(batch_start + GENERATE_BATCH, rows)):
+                post_number = index // MENTIONS_PER_POST
+                subreddit = rng.choices(SUBREDDITS, cum_weights=subreddit_weights)[0]
+                batch.append((
+                    f"g{post_number:x}",
+                    None if index % MENTIONS_PER_POST == 0 else f"{index:x}",
+                    rng.choices(tickers, cum_weights=cum_weights)[0], subreddit,
+                    oldest + index * step,
+                ))
+
+            connection.executemany(
+                '''INSERT INTO mentions (post_id, comment_id, ticker_symbol, subreddit,
+                mention_timestamp) VALUES (?, ?, ?, ?, ?)''', batch
+            )
+            connection.commit()
+            print(
+                f"Generated {batch_start + len(batch):,}/{rows:,} mentions "
+                f"({time.monotonic() - started:.0f}s)", file=sys.stderr
+            )
+
+        for statement in [*db_config.ROLLUP_REBUILD_STATEMENTS, *rollup_triggers, "ANALYZE"]:
+            connection.execute(statement)
+        connection.commit()
+
+    finally:
+        connection.close()
+
+    temp_path.replace(path)
+
+def get_mention_db(rows: int, tickers: list[str], seed: int, data_dir: Path = DATA_DIR) -> Path:
+    data_dir.mkdir(parents=True, exist_ok=True)
+    path = data_dir / f"mentions_{rows}_{seed}.db"
+
+    if not path.exists():
+        generate_mention_db(path, rows, tickers, seed)
+
+    return path
+
+def measure(function, repeat: int) -> dict:
+    '''
+    calls function repeat times, returning the median, p95 and fastest call times
+    in seconds...output printed by function is discarded
+    '''
+    timings = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(repeat):
+            start = time.perf_counter()
+            function()
+            timings.append(time.perf_counter() - start)
+
+    timings.sort()
+    return {
+        "median_s": timings[len(timings) // 2],
+        "p95_s": timings[min(int(len(timings) * 0.95), len(timings) - 1)],
+        "min_s": timings[0],
+        "repeat": repeat,
+    }
+
+def benchmark_extraction(extractor: TickerExtractor, word_lists, repeat: int) -> dict:
+    vocabulary = build_vocabulary(*word_lists)
+    short_corpus = generate_corpus(1000, 20, vocabulary)
+    long_corpus = generate_corpus(40, 500, vocabulary)
+
+    def extract_all(corpus):
+        for document in corpus:
+            extractor.extract(document)
+
+    # timed per corpus, reported per document
+    results = {}
+    for name, corpus in [("extract_short", short_corpus), ("extract_long", long_corpus)]:
+        result = measure(lambda: extract_all(corpus), repeat)
+        results[name] = {
+            key: value / len(corpus) if key.endswith("_s") else value
+            for key, value in result.items()
+        }
+
+    return results
+
+def benchmark_queries(tickers: list[str], repeat: int) -> dict:
+    cursor = db_config.get_connection().cursor()
+    cursor.execute("SELECT MAX(mention_timestamp) FROM mentions")
+    newest = cursor.fetchone()[0]
+
+    results = {}
+    for name, seconds in TIMEFRAMES.items():
+        mentions_since = 0.0 if seconds is None else newest - seconds
+        results[f"tickers_by_mention_count_{name}"] = measure(
+            lambda: get_tickers_by_mention_count(mentions_since), repeat
+        )
+
+    for rank in HOT_TICKER_RANKS:
+        ticker = tickers[rank - 1]
+        results[f"mentions_by_ticker_rank_{rank}"] = measure(
+            lambda: get_mentions_by_ticker(ticker), repeat
+        )
+
+    return results
+
+def benchmark_writes(tickers: list[str], repeat: int) -> dict:
+    rng = random.Random(0)
+    now = time.time()
+    run = iter(range(sys.maxsize))
+
+    def record_batch():
+        # the size of a busy 30 minute scrape, every mention new
+        number = next(run)
+        items = [
+            (ScrapedItem(text="", post_id=f"{BENCH_PREFIX}{number}", comment_id=f"{index}",
+                         timestamp=now, subreddit=BENCH_SUBREDDIT),
+             set(rng.sample(tickers[:500], 3)))
+            for index in range(200)
+        ]
+        record_mentions(items)
+
+    scraper = Scraper(BENCH_SUBREDDIT, 25, 100)
+
+    def listing_of(prefix: str, count: int, newest_index: int) -> list:
+        return [
+            {"id": f"{BENCH_PREFIX}{prefix}{index}", "name": f"t3_{BENCH_PREFIX}{prefix}{index}",
+             "created_utc": now + index}
+            for index in range(newest_index, newest_index - count, -1)
+        ]
+
+    def validate_posts():
+        # a listing of 25 posts of which 5 are new, the steady state of a scrape
+        number = next(run)
+        scraper.validate_and_record_posts(listing_of("p", 25, 5 * number))
+
+    def validate_comments():
+        number = next(run)
+        scraper.validate_and_record_comments(
+            listing_of("c", 100, 20 * number), f"{BENCH_PREFIX}post"
+        )
+
+    def validate_and_checkpoint():
+        # the validation of a run followed by its write back to the cache tables
+        validate_posts()
+        validate_comments()
+        get_seen_window().checkpoint()
+
+    try:
+        return {
+            "record_mentions_600": measure(record_batch, repeat),
+            "validate_and_record_posts_25": measure(validate_posts, repeat),
+            "validate_and_record_comments_100": measure(validate_comments, repeat),
+            "validate_and_checkpoint": measure(validate_and_checkpoint, repeat),
+        }
+
+    finally:
+        remove_benchmark_writes()
+
+def remove_benchmark_writes():
+    get_seen_window().discard_subreddit(BENCH_SUBREDDIT)
+    connection = db_config.get_connection()
+    # a range on the leading column of the unique index, rather than a LIKE, so
+    # only the benchmark's own rows are visited
+    connection.execute(
+        "DELETE FROM mentions WHERE post_id >= ? AND post_id < ?",
+        (BENCH_PREFIX, BENCH_PREFIX[:-1] + chr(ord(BENCH_PREFIX[-1]) + 1))
+    )
+    connection.execute("DELETE FROM post_cache WHERE subreddit = ?", (BENCH_SUBREDDIT,))
+    connection.execute("DELETE FROM comment_cache WHERE subreddit = ?", (BENCH_SUBREDDIT,))
+    connection.execute("DELETE FROM listing_cursors WHERE subreddit = ?", (BENCH_SUBREDDIT,))
+    connection.execute("DELETE FROM seen_filters WHERE subreddit = ?", (BENCH_SUBREDDIT,))
+    connection.commit()
+
+def compare_with_baseline(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    '''
+    returns the name of every benchmark whose median is more than tolerance (and
+    more than NOISE_FLOOR) slower than in the baseline
+    '''
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get("results", {}).get(name)
+        if previous is None:
+            continue
+
+        ratio = result["median_s"] / previous["median_s"]
+        regressed = (
+            ratio > 1 + tolerance and result["median_s"] - previous["median_s"] > NOISE_FLOOR
+        )
+        print(f"{'REGRESSION' if regressed else 'ok':>10}  {name}: {ratio:.2f}x baseline")
+        if regressed:
+            regressions.append(name)
+
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro benchmarks of the project's hot functions")
+    parser.add_argument("--size", choices=SIZES, default="10k", help="rows in the synthetic database")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--data-dir", type=Path, default=DATA_DIR, help="where synthetic databases are kept")
+    parser.add_argument("--save", type=Path, help="write the results to this JSON file")
+    parser.add_argument("--baseline", type=Path, help="compare with a previously saved result file")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown, 0.2 is 20%%")
+    args = parser.parse_args()
+
+    blacklisted_words, regular_words, random_words_dc = load_blacklist_files()
+    ticker_list = load_ticker_list_from_csv()
+    word_lists = (blacklisted_words, regular_words, random_words_dc, ticker_list)
+    extractor = TickerExtractor(Lexicon.build(*word_lists))
+    tickers = ranked_tickers(ticker_list, args.seed)
+
+    rows = SIZES[args.size]
+    db_config.DB_PATH = get_mention_db(rows, tickers, args.seed, args.data_dir)
+    # a database generated before the latest migration is brought up to date
+    db_config.initialise_db()
+
+    try:
+        results = {}
+        results.update(benchmark_extraction(extractor, word_lists, args.repeat))
+        results.update(benchmark_queries(tickers, args.repeat))
+        results.update(benchmark_writes(tickers, args.repeat))
+
+    finally:
+        db_config.close_connections()
+
+    for name, result in results.items():
+        print(
+            f"{name}: median {result['median_s'] * 1000:,.3f}ms, "
+            f"p95 {result['p95_s'] * 1000:,.3f}ms"
+        )
+
+    report = {
+        "meta": {
+            "size": args.size, "rows": rows, "seed": args.seed, "repeat": args.repeat,
+            "python": platform.python_version(), "sqlite": sqlite3.sqlite_version,
+            "machine": platform.machine(), "created_at": time.time(),
+        },
+        "results": results,
+    }
+    if args.save:
+        args.save.write_text(json.dumps(report, indent=2))
+
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text())
+        if baseline["meta"]["size"] != args.size:
+            print(f"NON-FATAL ERROR: Baseline was run at size {baseline['meta']['size']}, not {args.size}.")
+
+        regressions = compare_with_baseline(results, baseline, args.tolerance)
+        if regressions:
+            print(f"FATAL ERROR: {len(regressions)} benchmark(s) regressed: {', '.join(regressions)}")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+import argparse
+from blacklist_loader import load_blacklist_files
+from extraction_benchmark import build_vocabulary, generate_corpus
+import random
+import re
+import sys
+from text_normaliser import normalise_post, normalise_text
+from ticker_extractor import TickerExtractor
+from ticker_list_controller import load_ticker_list_from_csv
+import time
+
+"""
+checks that normalise_text returns exactly what the old two pass clean_text did
+for text without markdown, that the markdown it now strips is stripped, then
+reports how many documents per second each gets through and how much text, and
+how many candidate tokens, reach the extractor
+
+run from the src folder:
+    python3 normaliser_benchmark.py --documents 20000
+"""
+
+# ends of words, URLs and whitespace the old URL removal and collapsing had to
+# get right, mixed into the markdown free corpus
+PLAIN_FRAGMENTS = [
+    "https://example.com/AAPL?ref=TSLA", "http://t.co/x", "www.reddit.com/r/stocks",
+    "xhttp://glued.com", "http", "www", "awwwesome", "https", "\n", "\n\n", "\t", "  ",
+    " ", " ", "\r\n", "see:https://a.io/b,", "(www.sec.gov)",
+]
+
+# markdown normalise_text strips, with what should be left of it
+MARKDOWN_CASES = [
+    ("buy [GME](https://example.com/AMC) now", "buy GME now"),
+    ("see [https://a.io/TSLA](https://a.io/TSLA) here", "see here"),
+    ("&gt; I think NVDA is done\n\nno, AMD is", " no, AMD is"),
+    ("well\n> quoted MSFT\n> more INTC\nmine PLTR", "well mine PLTR"),
+    ("code:\n```\nimport AAPL\nx = TSLA\n```\nafter", "code: after"),
+    ("a ``` IBM ``` b", "a b"),
+    ("links https://x.com/A and www.y.com", "links and "),
+]
+# (title, selftext) of posts, whose body may open with a quote
+POST_CASES = [
+    (("AMD thoughts", "&gt; NVDA is done\n\nI think AMD"), "AMD thoughts I think AMD"),
+    (("GME https://x.com/AMC", "to the\tmoon"), "GME to the moon"),
+]
+
+def legacy_clean_text(text: str) -> str:
+    '''
+    clean_text as it was before the normaliser, kept as the golden reference for
+    text without markdown
+    '''
+    text = re.sub(r"http\S+|www\S+|https\S+", "", text)
+    return re.sub(r"\s+", " ", text)
+
+def generate_plain_corpus(corpus: list[str], seed: int = 0) -> list[str]:
+    rng = random.Random(seed)
+    plain = []
+    for document in corpus:
+        words = document.split(" ")
+        for _ in range(max(len(words) // 8, 1)):
+            words.insert(rng.randrange(len(words) + 1), rng.choice(PLAIN_FRAGMENTS))
+        plain.append(rng.choice(["", " "]).join(words) if rng.random() < 0.1 else " ".join(words))
+
+    return plain
+
+def generate_markdown_corpus(corpus: list[str], seed: int = 0) -> list[str]:
+    '''
+    the same documents written the way Reddit hands them over, some quoting a
+    previous comment, some with a code block, links and URLs
+    '''
+    rng = random.Random(seed)
+    markdown = []
+    for document in corpus:
+        words = document.split(" ")
+        parts = []
+        if rng.random() < 0.3:
+            quoted = " ".join(rng.sample(words, min(len(words), 15)))
+            parts.append(f"&gt; {quoted}\n\n")
+        parts.append(" ".join(words))
+        if rng.random() < 0.3:
+            parts.append(f" [{rng.choice(words)}](https://www.reddit.com/r/stocks/comments/{rng.randrange(10 ** 6)})")
+        if rng.random() < 0.2:
+            parts.append(f"\n\n```\n{' '.join(rng.sample(words, min(len(words), 10)))}\n```\n")
+        if rng.random() < 0.3:
+            parts.append(f" source: https://finance.example.com/quote/{rng.choice(words)}")
+        markdown.append("".join(parts))
+
+    return markdown
+
+def check_equivalence(corpus: list[str]) -> int:
+    for document in corpus:
+        expected = legacy_clean_text(document)
+        actual = normalise_text(document)
+        if actual != expected:
+            raise AssertionError(
+                f"Normalised text differs from legacy clean_text.\nDocument: {document!r}\n"
+                f"Expected: {expected!r}\nActual: {actual!r}"
+            )
+
+    for document, expected in MARKDOWN_CASES:
+        actual = normalise_text(document)
+        if actual != expected:
+            raise AssertionError(
+                f"Markdown not stripped as expected.\nDocument: {document!r}\n"
+                f"Expected: {expected!r}\nActual: {actual!r}"
+            )
+
+    for (title, selftext), expected in POST_CASES:
+        actual = normalise_post(title, selftext)
+        if actual != expected:
+            raise AssertionError(
+                f"Post not normalised as expected.\nTitle: {title!r}\nSelftext: {selftext!r}\n"
+                f"Expected: {expected!r}\nActual: {actual!r}"
+            )
+
+    return len(corpus) + len(MARKDOWN_CASES) + len(POST_CASES)
+
+def measure(clean, corpus: list[str]) -> float:
+    start = time.perf_counter()
+    for document in corpus:
+        clean(document)
+    elapsed = time.perf_counter() - start
+
+    return len(corpus) / elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description="Text normaliser equivalence check and benchmark")
+    parser.add_argument("--documents", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    blacklisted_words, regular_words, random_words_dc = load_blacklist_files()
+    ticker_list = load_ticker_list_from_csv()
+    vocabulary = build_vocabulary(blacklisted_words, regular_words, random_words_dc, ticker_list)
+    corpus = generate_corpus(args.documents, 60, vocabulary, args.seed)
+
+    corpora = {
+        "plain": generate_plain_corpus(corpus, args.seed),
+        "markdown": generate_markdown_corpus(corpus, args.seed),
+    }
+
+    try:
+        checked = check_equivalence(corpora["plain"])
+        print(f"Equivalence: {checked} documents match the legacy clean_text or expected output.")
+    except AssertionError as e:
+        print(f"FATAL ERROR: {e}")
+        sys.exit(1)
+
+    for name, documents in corpora.items():
+        legacy_rate = measure(legacy_clean_text, documents)
+        current_rate = measure(normalise_text, documents)
+
+        legacy_output = [legacy_clean_text(document) for document in documents]
+        current_output = [normalise_text(document) for document in documents]
+        legacy_tokens = sum(len(TickerExtractor.PATTERN.findall(text)) for text in legacy_output)
+        current_tokens = sum(len(TickerExtractor.PATTERN.findall(text)) for text in current_output)
+
+        print(
+            f"{name}: legacy {legacy_rate:,.0f} docs/s, normaliser {current_rate:,.0f} docs/s, "
+            f"{sum(map(len, legacy_output)):,} -> {sum(map(len, current_output)):,} characters "
+            f"and {legacy_tokens:,} -> {current_tokens:,} candidate tokens reach the extractor"
+        )
+
+if __name__ == "__main__":
+    main()
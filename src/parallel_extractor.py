@@ -0,0 +1,126 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from extraction_memo import ExtractionMemo, get_extraction_memo
+from itertools import chain, islice
+from lexicon import Lexicon
+import metrics
+import multiprocessing
+import os
+from scraper import ScrapedItem
+from ticker_extractor import TickerExtractor
+import time
+from typing import Iterable, Iterator
+
+"""
+fans ticker extraction out to a pool of worker processes for runs large enough to
+be CPU-bound, such as big catch-up scrapes or historical loads, while small runs
+stay inline where starting a pool would cost more than it saves...a run is
+extracted inline as its items arrive and only moves to the pool once it has gone
+past INLINE_THRESHOLD items
+
+each worker receives the lexicon once, when it starts, and builds its own
+TickerExtractor from it...only the text of each ScrapedItem is sent out, in
+batches, and the results come back in the same order the items went in, so the
+mention writer downstream sees exactly what inline extraction would have given it
+
+both inline and in the workers, text that was extracted recently is answered from
+an ExtractionMemo (see extraction_memo.py), the hits and misses are recorded as
+the extract_memo stage
+"""
+
+# items of a run extracted inline before the rest goes to the pool
+INLINE_THRESHOLD = 5000
+# items sent to a worker at a time, large enough to amortise the pickling round trip
+BATCH_SIZE = 500
+# batches allowed in flight per worker, bounds memory when the input is a stream
+BATCHES_PER_WORKER = 2
+# the pool starts while the scraper's fetch threads and the mention writer are
+# running, forking then could copy a lock one of them holds into a worker, so
+# workers start from a clean process instead (spawn where forkserver is missing)
+START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+_worker_extractor = None
+_worker_memo = None
+
+def _init_worker(lexicon: Lexicon):
+    global _worker_extractor, _worker_memo
+    _worker_extractor = TickerExtractor(lexicon)
+    _worker_memo = ExtractionMemo()
+
+def _extract_batch(texts: list[str]) -> tuple[list[frozenset[str]], float, int]:
+    # the time is measured in the worker, so it excludes the pickling round trip
+    start = time.perf_counter()
+    hits = _worker_memo.hits
+    results = [_worker_memo.extract(_worker_extractor, text) for text in texts]
+
+    return results, time.perf_counter() - start, _worker_memo.hits - hits
+
+def _record_memo(hits: int, lookups: int, mode: str):
+    metrics.record("extract_memo", items=hits, result="hit", mode=mode)
+    metrics.record("extract_memo", items=lookups - hits, result="miss", mode=mode)
+
+def _batched(items: Iterator, batch_size: int) -> Iterator[list]:
+    while batch := list(islice(items, batch_size)):
+        yield batch
+
+def _collect(batch: list[ScrapedItem], future) -> Iterator[tuple[ScrapedItem, frozenset[str]]]:
+    results, seconds, hits = future.result()
+    metrics.record("extract", seconds, len(batch), mode="pool")
+    _record_memo(hits, len(batch), "pool")
+
+    return zip(batch, results)
+
+def extract_items(ticker_extractor: TickerExtractor, items: Iterable[ScrapedItem],
+                  workers: int = None, inline_threshold: int = INLINE_THRESHOLD,
+                  batch_size: int = BATCH_SIZE) -> Iterator[tuple[ScrapedItem, frozenset[str]]]:
+    '''
+    yields (item, tickers) for every item, in input order, items may be any
+    iterable including a generator of unknown length...the first
+    inline_threshold items are extracted inline and any after them by the pool,
+    workers defaults to one per core, and inline_threshold=0 uses the pool for
+    everything
+    '''
+    items = iter(items)
+
+    # every item is extracted as soon as it arrives, interleaved with fetching, until
+    # the run turns out to be large...only then is the rest handed to the pool, so a
+    # normal scrape never holds items back waiting to learn its own size
+    extraction_seconds = 0.0
+    inline_count = 0
+    memo = get_extraction_memo()
+    hits = memo.hits
+    for item in islice(items, inline_threshold):
+        start = time.perf_counter()
+        tickers = memo.extract(ticker_extractor, item.text)
+        extraction_seconds += time.perf_counter() - start
+        inline_count += 1
+        yield item, tickers
+
+    # timed per item but recorded once for the run
+    if inline_count:
+        metrics.record("extract", extraction_seconds, inline_count, mode="inline")
+        _record_memo(memo.hits - hits, inline_count, "inline")
+
+    first = next(items, None)
+    if first is None:
+        return
+
+    items = chain([first], items)
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context(START_METHOD),
+        initializer=_init_worker, initargs=(ticker_extractor.lexicon,)
+    ) as executor:
+        max_in_flight = workers * BATCHES_PER_WORKER
+        in_flight = deque()
+
+        for batch in _batched(items, batch_size):
+            in_flight.append((batch, executor.submit(_extract_batch, [item.text for item in batch])))
+
+            # waiting on the oldest batch keeps results in order and stops us from
+            # reading further ahead than max_in_flight batches
+            if len(in_flight) >= max_in_flight:
+                yield from _collect(*in_flight.popleft())
+
+        while in_flight:
+            yield from _collect(*in_flight.popleft())
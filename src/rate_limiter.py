@@ -0,0 +1,127 @@
+import random
+import threading
+import time
+
+"""
+a token bucket shared by every request to a rate limited API, Reddit counts our
+requests over a fixed window and reports what is left of it on every response
+(X-Ratelimit-Remaining requests, X-Ratelimit-Reset seconds until the window
+resets), so the bucket starts at a configured rate and, as soon as those headers
+arrive, refills at exactly the rate that spends the remaining budget by the end of
+the window...bursts of up to burst requests go out at once, anything beyond that is
+spread evenly, which uses the whole budget without ever running past it
+
+a 429 pauses every caller until the window resets (or for Retry-After), and 429s
+and 5xx responses are retried with jittered exponential backoff so a brief outage
+or a miscounted window costs a few seconds instead of the run
+"""
+
+# statuses worth retrying, anything else is the caller's problem
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+class RateLimiter:
+    """
+    thread safe, acquire() before every request and release() with its response
+    """
+    def __init__(self, requests_per_second: float = 1.0, burst: int = 30,
+                 max_retries: int = 4, backoff_base: float = 1.0, backoff_cap: float = 60.0):
+        self.__default_rate = requests_per_second
+        self.__rate = requests_per_second
+        self.__burst = burst
+        self.__tokens = float(burst)
+        self.__updated = time.monotonic()
+        # requests acquired but not released yet, the server has not counted them
+        # in the remaining budget it reports
+        self.__in_flight = 0
+        self.__paused_until = 0.0
+        self.__lock = threading.Lock()
+
+        self.max_retries = max_retries
+        self.__backoff_base = backoff_base
+        self.__backoff_cap = backoff_cap
+
+    def __refill(self, now: float):
+        # time spent paused does not earn tokens, the window it belongs to is spent
+        elapsed = now - max(self.__updated, self.__paused_until)
+        if elapsed > 0:
+            self.__tokens = min(self.__tokens + elapsed * self.__rate, self.__burst)
+        self.__updated = now
+
+    def acquire(self) -> float:
+        '''
+        blocks until a request may be sent, returns the seconds spent waiting
+        '''
+        waited = 0.0
+
+        while True:
+            with self.__lock:
+                now = time.monotonic()
+                self.__refill(now)
+
+                if now >= self.__paused_until and self.__tokens >= 1:
+                    self.__tokens -= 1
+                    self.__in_flight += 1
+                    return waited
+
+                delay = max(self.__paused_until - now, 0.0)
+                if self.__tokens < 1:
+                    delay += (1 - self.__tokens) / self.__rate if self.__rate else 1.0
+
+            time.sleep(delay)
+            waited += delay
+
+    def release(self, status: int = None, headers: dict = None):
+        '''
+        folds the response's rate limit headers, if any, into the bucket...a 429
+        pauses every caller until the window resets
+        '''
+        headers = headers or {}
+
+        try:
+            remaining = float(headers["X-Ratelimit-Remaining"])
+            reset = float(headers["X-Ratelimit-Reset"])
+        except (KeyError, TypeError, ValueError):
+            remaining = reset = None
+
+        with self.__lock:
+            self.__in_flight = max(self.__in_flight - 1, 0)
+            now = time.monotonic()
+            self.__refill(now)
+
+            if remaining is not None:
+                # our other requests in flight will come out of what is left
+                available = max(remaining - self.__in_flight, 0.0)
+                self.__tokens = min(self.__tokens, available)
+
+                if available >= 1:
+                    self.__rate = available / max(reset, 1.0)
+                else:
+                    # nothing left until the window resets, after which the
+                    # configured rate holds until the next response says otherwise
+                    self.__rate = self.__default_rate
+                    self.__paused_until = max(self.__paused_until, now + reset)
+
+            if status == 429:
+                retry_after = retry_after_seconds(headers)
+                if retry_after is None:
+                    retry_after = reset if reset is not None else self.__backoff_base
+                self.__tokens = 0.0
+                self.__paused_until = max(self.__paused_until, now + retry_after)
+
+    def backoff(self, attempt: int) -> float:
+        '''
+        seconds to wait before retry number attempt (from 0), full jitter so
+        concurrent callers that failed together do not retry together
+        '''
+        return random.uniform(0, min(self.__backoff_cap, self.__backoff_base * 2 ** attempt))
+
+    @property
+    def requests_per_second(self) -> float:
+        return self.__rate
+
+def retry_after_seconds(headers: dict):
+    # only the delta-seconds form, Reddit does not send HTTP dates
+    try:
+        return float(headers["Retry-After"])
+    except (KeyError, TypeError, ValueError):
+        return None
@@ -0,0 +1,496 @@
+import argparse
+from collections import Counter
+from dataclasses import dataclass
+import hashlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+from pathlib import Path
+import random
+import re
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+"""
+a local stand-in for the Reddit JSON endpoints and the Nasdaq screener API, so the
+whole pipeline can be driven and measured offline and reproducibly
+
+by default every payload is synthesised: each subreddit gets a stream of posts
+that grows by new_posts_per_request every time its newest posts are requested, a
+subreddit wide comment stream that grows the same way, and each post has comments
+whose text is drawn from a vocabulary of words and tickers...alternatively,
+payloads recorded from the live sites with --record are replayed, with before= and
+after= applied to recorded listings the way Reddit would, and any request without
+a recording falls back to synthetic data
+
+latency (plus uniform jitter) is added to every response and error_rate of them
+fail with a 503 or 429, to see how the scraper copes
+
+run from the src folder:
+    python3 reddit_standin.py --record fixtures
+    python3 reddit_standin.py --port 8765 --latency 0.05 --fixtures fixtures
+"""
+
+LISTING_PATH = re.compile(r"^/r/(?P<subreddit>[^/]+)/new\.json$")
+STREAM_PATH = re.compile(r"^/r/(?P<subreddit>[^/]+)/comments\.json$")
+COMMENTS_PATH = re.compile(r"^/r/(?P<subreddit>[^/]+)/comments/(?P<post_id>[^/]+)/?\.json$")
+MORECHILDREN_PATH = re.compile(r"^/api/morechildren(\.json)?$")
+SCREENER_PATH = "/api/screener/stocks"
+STATS_PATH = "/__stats"
+
+# every synthetic post (stream comment) is this many seconds newer than the one
+# before it
+POST_INTERVAL = 60
+STREAM_COMMENT_INTERVAL = 5
+
+@dataclass
+class StandinConfig:
+    latency: float = 0.0
+    jitter: float = 0.0
+    error_rate: float = 0.0
+    # posts that exist in each subreddit before the first request
+    initial_posts: int = 25
+    # posts minted in a subreddit every time the top of its listing is requested
+    new_posts_per_request: int = 2
+    # comments in each subreddit's comment stream before the first request, and
+    # minted every time the top of the stream is requested
+    initial_stream_comments: int = 100
+    new_comments_per_request: int = 20
+    comments_per_post: int = 20
+    # Reddit requests allowed per window, answered with X-Ratelimit headers and
+    # a 429 once spent, 0 disables the limit
+    ratelimit_budget: int = 0
+    ratelimit_window: float = 600.0
+    words_per_text: int = 30
+    ticker_count: int = 7000
+    fixtures_dir: Path = None
+    seed: int = 0
+
+class StandinState:
+    def __init__(self, config: StandinConfig, vocabulary: list[str], tickers: list[str]):
+        self.config = config
+        self.vocabulary = vocabulary
+        self.tickers = tickers
+        self.request_counts = Counter()
+        self.error_counts = Counter()
+        self.bytes_sent = 0
+        # items minted so far per (subreddit, kind), t3 posts or t1 stream comments
+        self.__item_counts = {}
+        self.__lock = threading.Lock()
+        self.__rng = random.Random(config.seed)
+        self.__base_time = time.time()
+        self.__post_subreddits = {}
+        self.__window_started = time.monotonic()
+        self.__window_used = 0
+
+    def should_fail(self) -> bool:
+        with self.__lock:
+            return self.__rng.random() < self.config.error_rate
+
+    def take_ratelimit(self) -> tuple[bool, dict]:
+        '''
+        counts a request against the current window, returns whether it is
+        allowed and the X-Ratelimit headers to answer it with
+        '''
+        with self.__lock:
+            now = time.monotonic()
+            window = self.config.ratelimit_window
+            if now - self.__window_started >= window:
+                self.__window_started = now
+                self.__window_used = 0
+
+            allowed = self.__window_used < self.config.ratelimit_budget
+            if allowed:
+                self.__window_used += 1
+            reset = window - (now - self.__window_started)
+
+            return allowed, {
+                "X-Ratelimit-Used": str(self.__window_used),
+                "X-Ratelimit-Remaining": f"{self.config.ratelimit_budget - self.__window_used:.1f}",
+                "X-Ratelimit-Reset": str(max(int(reset), 1)),
+            }
+
+    def text_for(self, item_id: str) -> str:
+        # seeded by the item's id so the same item always has the same text
+        rng = random.Random(f"{self.config.seed}:{item_id}")
+        return " ".join(rng.choices(self.vocabulary, k=self.config.words_per_text))
+
+    def advance_listing(self, subreddit: str, kind: str, before: str, after: str) -> int:
+        with self.__lock:
+            is_post = kind == "t3"
+            count = self.__item_counts.get(
+                (subreddit, kind),
+                self.config.initial_posts if is_post else self.config.initial_stream_comments
+            )
+            # a client paging through items it has not caught up with yet is still
+            # reading the same moment in time, only a fresh look at the top of the
+            # listing finds new ones
+            paging = after or (before and self.item_index(subreddit, kind, before) < count - 1)
+            if not paging:
+                count += (
+                    self.config.new_posts_per_request if is_post
+                    else self.config.new_comments_per_request
+                )
+            self.__item_counts[(subreddit, kind)] = count
+            return count
+
+    def item_index(self, subreddit: str, kind: str, fullname: str) -> int:
+        return int(fullname.removeprefix(f"{kind}_").removeprefix(self.id_prefix(subreddit, kind)), 16)
+
+    def id_prefix(self, subreddit: str, kind: str) -> str:
+        # stream comment ids get an "s", which is not a hex digit, after the
+        # subreddit so they never collide with post ids
+        return subreddit.lower() if kind == "t3" else f"{subreddit.lower()}s"
+
+    def page(self, subreddit: str, kind: str, limit: int, before: str, after: str) -> range:
+        count = self.advance_listing(subreddit, kind, before, after)
+        # like Reddit, before= pages towards newer items and after= towards older
+        # ones, both relative to the fullname given and always newest first
+        if before:
+            oldest = self.item_index(subreddit, kind, before) + 1
+            newest = min(oldest + limit, count) - 1
+        else:
+            newest = self.item_index(subreddit, kind, after) - 1 if after else count - 1
+            oldest = max(newest - limit + 1, 0)
+
+        return range(newest, oldest - 1, -1)
+
+    def post_created(self, index: int) -> float:
+        return self.__base_time + index * POST_INTERVAL
+
+    def post(self, subreddit: str, index: int) -> dict:
+        post_id = f"{self.id_prefix(subreddit, 't3')}{index:x}"
+        return {
+            "id": post_id, "name": f"t3_{post_id}", "subreddit": subreddit,
+            "title": self.text_for(post_id + "t"), "selftext": self.text_for(post_id),
+            "created_utc": self.post_created(index), "author": "standin",
+        }
+
+    def listing(self, subreddit: str, limit: int, before: str = None, after: str = None) -> dict:
+        posts = [self.post(subreddit, index) for index in self.page(subreddit, "t3", limit, before, after)]
+        return self.wrap_listing("t3", posts)
+
+    def comment_stream(self, subreddit: str, limit: int, before: str = None, after: str = None) -> dict:
+        comments = []
+        post_count = self.__item_counts.get((subreddit, "t3"), self.config.initial_posts)
+        for index in self.page(subreddit, "t1", limit, before, after):
+            comment_id = f"{self.id_prefix(subreddit, 't1')}{index:x}"
+            # spread over the ten newest posts, as a live subreddit's comments are
+            post_id = f"{self.id_prefix(subreddit, 't3')}{max(post_count - 1 - index % 10, 0):x}"
+            comments.append({
+                "id": comment_id, "name": f"t1_{comment_id}", "link_id": f"t3_{post_id}",
+                "subreddit": subreddit, "body": self.text_for(comment_id),
+                "created_utc": self.__base_time + index * STREAM_COMMENT_INTERVAL,
+                "author": "standin",
+            })
+
+        return self.wrap_listing("t1", comments)
+
+    def wrap_listing(self, kind: str, items: list) -> dict:
+        return {"kind": "Listing", "data": {
+            "children": [{"kind": kind, "data": item} for item in items],
+            "after": items[-1]["name"] if items else None,
+            "before": items[0]["name"] if items else None,
+        }}
+
+    def comment(self, subreddit: str, post_id: str, index: int) -> dict:
+        # ids are minted from the post id, so every post keeps the same comments
+        comment_id = f"{post_id}x{index:x}"
+        return {
+            "id": comment_id, "name": f"t1_{comment_id}", "link_id": f"t3_{post_id}",
+            "subreddit": subreddit, "body": self.text_for(comment_id),
+            "created_utc": self.__base_time + index, "author": "standin",
+        }
+
+    def comments(self, subreddit: str, post_id: str, limit: int) -> list:
+        # morechildren only gets the post's fullname, remember where it lives
+        self.__post_subreddits[post_id] = subreddit
+        newest_first = range(self.config.comments_per_post - 1, -1, -1)
+        comments = [
+            {"kind": "t1", "data": self.comment(subreddit, post_id, index)}
+            for index in newest_first[:limit]
+        ]
+        # like Reddit, whatever did not fit is left behind a "more" object
+        hidden_ids = [f"{post_id}x{index:x}" for index in newest_first[limit:]]
+        if hidden_ids:
+            comments.append({"kind": "more", "data": {
+                "count": len(hidden_ids), "children": hidden_ids, "parent_id": f"t3_{post_id}",
+            }})
+
+        post_listing = {"kind": "Listing", "data": {"children": [], "after": None, "before": None}}
+        comment_listing = {"kind": "Listing", "data": {
+            "children": comments, "after": None, "before": None,
+        }}
+        return [post_listing, comment_listing]
+
+    def more_children(self, link_id: str, comment_ids: list[str]) -> dict:
+        post_id = link_id.removeprefix("t3_")
+        subreddit = self.__post_subreddits.get(post_id, "")
+        things = [
+            {"kind": "t1", "data": self.comment(subreddit, post_id, int(comment_id.rsplit("x", 1)[1], 16))}
+            for comment_id in comment_ids
+        ]
+        return {"json": {"errors": [], "data": {"things": things}}}
+
+    def screener(self) -> dict:
+        return {"data": {"rows": [{"symbol": ticker} for ticker in self.tickers]}}
+
+def build_handler(state: StandinState):
+    class StandinHandler(BaseHTTPRequestHandler):
+        # keeps connections alive the way Reddit and Nasdaq do, so the client's
+        # connection pooling behaves as it would in production
+        protocol_version = "HTTP/1.1"
+        # small responses on a kept alive connection otherwise sit out Nagle's
+        # algorithm against the client's delayed ACK, ~40ms each
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = {name: values[0] for name, values in parse_qs(url.query).items()}
+
+            if url.path == STATS_PATH:
+                return self.send_json(200, {
+                    "requests": state.request_counts, "errors": state.error_counts,
+                    "bytes_sent": state.bytes_sent,
+                })
+
+            if state.config.latency or state.config.jitter:
+                time.sleep(state.config.latency + random.uniform(0, state.config.jitter))
+
+            endpoint, payload = self.route(url.path, query)
+            if endpoint is None:
+                return self.send_json(404, {"message": "Not Found", "error": 404})
+
+            state.request_counts[endpoint] += 1
+            headers = {}
+            if state.config.ratelimit_budget and endpoint != "screener":
+                allowed, headers = state.take_ratelimit()
+                if not allowed:
+                    state.error_counts[endpoint] += 1
+                    return self.send_json(429, {"message": "Too Many Requests", "error": 429}, headers)
+
+            if state.should_fail():
+                state.error_counts[endpoint] += 1
+                status = random.choice([429, 503])
+                return self.send_json(status, {"message": "Simulated failure", "error": status}, headers)
+
+            # the screener answers conditional requests like a CDN would
+            self.send_json(200, payload, headers, etag=endpoint == "screener")
+
+        def route(self, path: str, query: dict):
+            limit = int(query.get("limit", 25))
+            before = query.get("before")
+            after = query.get("after")
+
+            if match := LISTING_PATH.match(path):
+                fixture = read_fixture(state.config.fixtures_dir, "r", match["subreddit"], "new.json")
+                if fixture:
+                    return "listing", page_fixture(fixture, limit, before, after)
+                return "listing", state.listing(match["subreddit"], limit, before, after)
+
+            if match := STREAM_PATH.match(path):
+                fixture = read_fixture(state.config.fixtures_dir, "r", match["subreddit"], "comments.json")
+                if fixture:
+                    return "comment_stream", page_fixture(fixture, limit, before, after)
+                return "comment_stream", state.comment_stream(match["subreddit"], limit, before, after)
+
+            if match := COMMENTS_PATH.match(path):
+                fixture = read_fixture(
+                    state.config.fixtures_dir, "r", match["subreddit"], "comments",
+                    f"{match['post_id']}.json"
+                )
+                return "comments", fixture or state.comments(match["subreddit"], match["post_id"], limit)
+
+            if MORECHILDREN_PATH.match(path):
+                return "morechildren", state.more_children(
+                    query.get("link_id", ""), query.get("children", "").split(",")
+                )
+
+            if path == SCREENER_PATH:
+                fixture = read_fixture(state.config.fixtures_dir, "screener.json")
+                return "screener", fixture or state.screener()
+
+            return None, None
+
+        def send_json(self, status: int, payload, headers: dict = None, etag: bool = False):
+            body = json.dumps(payload).encode()
+
+            if etag:
+                tag = f'"{hashlib.blake2b(body, digest_size=8).hexdigest()}"'
+                headers = {**(headers or {}), "ETag": tag}
+                if self.headers.get("If-None-Match") == tag:
+                    status, body = 304, b""
+
+            state.bytes_sent += len(body)
+
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+    return StandinHandler
+
+def read_fixture(fixtures_dir: Path, *parts: str):
+    if fixtures_dir is None:
+        return None
+
+    fixture_file = fixtures_dir.joinpath(*parts)
+    if not fixture_file.exists():
+        return None
+
+    return json.loads(fixture_file.read_text())
+
+def page_fixture(listing: dict, limit: int, before: str = None, after: str = None) -> dict:
+    '''
+    the page of a recorded listing (newest first) a request with these cursors gets,
+    after= pages towards older items and before= towards newer ones...a cursor that
+    isn't in the recording gets an empty page, like a deleted item does on Reddit
+    '''
+    children = listing["data"]["children"]
+    names = [child["data"].get("name") for child in children]
+
+    if after:
+        start = names.index(after) + 1 if after in names else len(children)
+        end = min(start + limit, len(children))
+    elif before:
+        end = names.index(before) if before in names else 0
+        start = max(end - limit, 0)
+    else:
+        start, end = 0, min(limit, len(children))
+
+    page = children[start:end]
+    return {"kind": "Listing", "data": {
+        **listing["data"],
+        "children": page,
+        # like Reddit, no after= once the oldest item was handed out
+        "after": names[end - 1] if page and end < len(children) else None,
+        "before": names[start] if page else None,
+    }}
+
+def record_fixtures(fixtures_dir: Path, subreddits: list[str], post_count: int,
+                    comments_count: int):
+    '''
+    saves the live listings, comment pages and screener payload under fixtures_dir,
+    laid out the way the stand-in looks them up
+    '''
+    # imported here so serving never needs the live client's configuration
+    import http_client
+    from scraper import Scraper
+    from ticker_list_controller import HEADERS, TIMEOUT, URL
+
+    def save(payload, *parts: str):
+        fixture_file = fixtures_dir.joinpath(*parts)
+        fixture_file.parent.mkdir(parents=True, exist_ok=True)
+        fixture_file.write_text(json.dumps(payload))
+
+    for subreddit in subreddits:
+        response = http_client.get(
+            f"{Scraper.BASE_URL}/r/{subreddit}/new.json?limit={post_count}",
+            headers=Scraper.HEADERS, timeout=Scraper.TIMEOUT
+        )
+        response.raise_for_status()
+        listing = response.json()
+        save(listing, "r", subreddit, "new.json")
+
+        for post in listing["data"]["children"]:
+            post_id = post["data"]["id"]
+            response = http_client.get(
+                f"{Scraper.BASE_URL}/r/{subreddit}/comments/{post_id}/.json?limit={comments_count}",
+                headers=Scraper.HEADERS, timeout=Scraper.TIMEOUT
+            )
+            response.raise_for_status()
+            save(response.json(), "r", subreddit, "comments", f"{post_id}.json")
+
+        response = http_client.get(
+            f"{Scraper.BASE_URL}/r/{subreddit}/comments.json?limit=100",
+            headers=Scraper.HEADERS, timeout=Scraper.TIMEOUT
+        )
+        response.raise_for_status()
+        save(response.json(), "r", subreddit, "comments.json")
+
+        print(f"Recorded r/{subreddit}: {len(listing['data']['children'])} posts.")
+
+    response = http_client.get(URL, headers=HEADERS, timeout=TIMEOUT)
+    response.raise_for_status()
+    save(response.json(), "screener.json")
+    print(f"Recorded the Nasdaq screener into {fixtures_dir}.")
+
+def load_vocabulary(config: StandinConfig) -> tuple[list[str], list[str]]:
+    '''
+    returns (vocabulary, tickers), words come from our own blacklists so the text
+    exercises the extractor's filtering, tickers from the committed ticker list
+    '''
+    # imported here so the server can also run from a bare checkout of this file
+    from blacklist_loader import load_blacklist_files
+    from ticker_list_controller import load_ticker_list_from_csv
+
+    blacklisted_words, regular_words, random_words_dc = load_blacklist_files()
+    tickers = sorted(load_ticker_list_from_csv())[:config.ticker_count]
+
+    rng = random.Random(config.seed)
+    words = sorted(regular_words | random_words_dc | blacklisted_words)
+    vocabulary = (
+        [word.lower() for word in rng.sample(words, min(3000, len(words)))]
+        + rng.sample(words, min(300, len(words)))
+        + rng.sample(tickers, min(400, len(tickers)))
+    )
+
+    return vocabulary, tickers
+
+def start_standin(config: StandinConfig, host: str = "127.0.0.1", port: int = 0):
+    '''
+    starts the stand-in on a background thread and returns (server, state), port 0
+    picks a free port, read it back from server.server_port
+    '''
+    vocabulary, tickers = load_vocabulary(config)
+    state = StandinState(config, vocabulary, tickers)
+
+    server = ThreadingHTTPServer((host, port), build_handler(state))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return server, state
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for Reddit and Nasdaq endpoints")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra random seconds, up to this much")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests that fail")
+    parser.add_argument("--new-posts-per-request", type=int, default=2)
+    parser.add_argument("--comments-per-post", type=int, default=20)
+    parser.add_argument("--ratelimit-budget", type=int, default=0,
+                        help="Reddit requests allowed per --ratelimit-window seconds, 0 for no limit")
+    parser.add_argument("--ratelimit-window", type=float, default=600.0)
+    parser.add_argument("--fixtures", type=Path, help="folder of recorded payloads to replay")
+    parser.add_argument("--record", type=Path, help="record live payloads into this folder and exit")
+    args = parser.parse_args()
+
+    if args.record:
+        from main import COMMENTS_TO_COLLECT, POSTS_TO_COLLECT, SUBREDDITS
+        return record_fixtures(args.record, SUBREDDITS, POSTS_TO_COLLECT, COMMENTS_TO_COLLECT)
+
+    config = StandinConfig(
+        latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+        new_posts_per_request=args.new_posts_per_request,
+        comments_per_post=args.comments_per_post, ratelimit_budget=args.ratelimit_budget,
+        ratelimit_window=args.ratelimit_window, fixtures_dir=args.fixtures
+    )
+    server, _ = start_standin(config, args.host, args.port)
+    print(f"Stand-in serving on http://{args.host}:{server.server_port} (CTRL/CMD + C to stop)")
+
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+import argparse
+import contextlib
+import db_config
+import http_client
+import io
+import json
+import lexicon
+import main
+import mention_writer
+import metrics
+from pathlib import Path
+from rate_limiter import RateLimiter
+from reddit_standin import StandinConfig, start_standin
+from scraper import Scraper
+import seen_window
+import shutil
+import tempfile
+import ticker_list_controller
+import time
+
+"""
+drives update_ticker_list and execute_scrape end to end against the local stand-in
+for Reddit and Nasdaq (see reddit_standin.py), so a performance change can be
+measured offline, on the same data, run after run
+
+everything the pipeline writes, the database, the ticker list and the compiled
+lexicon, goes to a temporary folder which is removed afterwards, the real
+database and ticker list are never touched...for each run it reports items per
+second, requests per endpoint, rows written to the database, and p50/p99 latency
+of each stage and of the individual HTTP requests
+
+run from the src folder:
+    python3 scrape_benchmark.py --runs 10 --latency 0.05 --error-rate 0.01
+"""
+
+def percentile(values: list[float], fraction: float) -> float:
+    # nearest rank, plenty for a benchmark report
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+def redirect_pipeline(base_url: str, work_dir: Path):
+    '''
+    points every module level URL and path the pipeline uses at the stand-in and
+    at work_dir
+    '''
+    Scraper.BASE_URL = base_url
+    ticker_list_controller.URL = f"{base_url}/api/screener/stocks?tableonly=true&limit=0&download=true"
+    ticker_list_controller.TICKERS_PATH = work_dir / "tickers"
+    ticker_list_controller.TICKER_LIST_FILE = work_dir / "tickers" / "ticker_list.csv"
+    ticker_list_controller.DOWNLOAD_STATE_FILE = work_dir / "tickers" / "ticker_list_download.json"
+    ticker_list_controller.CHANGES_FILE = work_dir / "tickers" / "ticker_list_changes.jsonl"
+    lexicon.TICKER_LIST_FILE = ticker_list_controller.TICKER_LIST_FILE
+    lexicon.LEXICON_FILE = work_dir / "tickers" / "lexicon.pickle"
+    db_config.DB_PATH = work_dir / "database" / "reddit_ticker_data.db"
+    main.METRICS_FILE = work_dir / "metrics" / "reddit_tracker.prom"
+
+def timed(stage_times: dict, stage: str, function, quiet: bool):
+    output = io.StringIO() if quiet else None
+    start = time.perf_counter()
+
+    try:
+        with contextlib.redirect_stdout(output) if quiet else contextlib.nullcontext():
+            return function()
+
+    finally:
+        stage_times.setdefault(stage, []).append(time.perf_counter() - start)
+
+def run_benchmark(config: StandinConfig, runs: int, quiet: bool = True,
+                  rate_limiter: RateLimiter = None) -> dict:
+    work_dir = Path(tempfile.mkdtemp(prefix="scrape_benchmark_"))
+    server, state = start_standin(config)
+
+    try:
+        redirect_pipeline(f"http://127.0.0.1:{server.server_port}", work_dir)
+        # a fresh bucket per benchmark, the stand-in's X-Ratelimit headers (with
+        # --ratelimit-budget) take over from its starting rate like Reddit's would
+        Scraper.RATE_LIMITER = rate_limiter or RateLimiter()
+        timed({}, "boot", main.boot_sequence, quiet)
+
+        stage_times = {}
+        run_results = []
+        for _ in range(runs):
+            requests_before = sum(state.request_counts.values())
+            # mentions are written by the writer thread, on its own connection
+            changes_before = db_config.get_total_changes()
+
+            # the ticker list is refreshed daily and the scrape every 30 minutes,
+            # both are timed on every run so each gets a distribution...a failed
+            # request is fatal to the job in production, here it only fails the run
+            try:
+                timed(stage_times, "ticker_update", main.update_ticker_list, quiet)
+                summary = timed(stage_times, "scrape", main.execute_scrape, quiet)
+                summary.update(seconds=stage_times["scrape"][-1], error=None)
+            except Exception as e:
+                summary = {"items": 0, "inserted": 0, "ignored": 0, "seconds": 0.0, "error": str(e)}
+
+            run_results.append({
+                **summary,
+                "requests": sum(state.request_counts.values()) - requests_before,
+                "db_row_writes": db_config.get_total_changes() - changes_before,
+                # what each pipeline stage cost, as recorded by the metrics module
+                "stages": metrics.run_summary(),
+            })
+
+        http_times = [
+            duration for durations in http_client.get_request_durations().values()
+            for duration in durations
+        ]
+        stage_times["http_request"] = http_times
+
+        total_items = sum(result["items"] for result in run_results)
+        total_seconds = sum(result["seconds"] for result in run_results)
+
+        return {
+            "runs": run_results,
+            "items_per_second": total_items / total_seconds if total_seconds else 0.0,
+            "requests_by_endpoint": dict(state.request_counts),
+            "errors_by_endpoint": dict(state.error_counts),
+            "bytes_served": state.bytes_sent,
+            "latency": {
+                stage: {
+                    "count": len(times), "p50": percentile(times, 0.5),
+                    "p99": percentile(times, 0.99),
+                }
+                for stage, times in stage_times.items()
+            },
+        }
+
+    finally:
+        server.shutdown()
+        # the window belongs to the temporary database
+        seen_window.reset_seen_window()
+        mention_writer.close_mention_writer()
+        db_config.close_connections()
+        http_client.close_session()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+def print_report(report: dict):
+    for number, result in enumerate(report["runs"], start=1):
+        if result["error"]:
+            print(f"Run {number}: failed after {result['requests']} requests: {result['error']}")
+            continue
+
+        print(
+            f"Run {number}: {result['items']} items in {result['seconds']:.2f}s, "
+            f"{result['requests']} requests, {result['db_row_writes']} rows written, "
+            f"{result['inserted']} mentions recorded ({result['ignored']} ignored)"
+        )
+        for stage, stats in sorted(result["stages"].items()):
+            print(f"  {stage}: {stats['seconds'] * 1000:,.1f}ms over {stats['calls']} calls")
+
+    print(f"Throughput: {report['items_per_second']:,.1f} items/s")
+    print(f"Requests: {report['requests_by_endpoint']}, failed: {report['errors_by_endpoint']}")
+    for stage, latency in report["latency"].items():
+        print(
+            f"{stage}: p50 {latency['p50'] * 1000:,.1f}ms, p99 {latency['p99'] * 1000:,.1f}ms "
+            f"over {latency['count']} samples"
+        )
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="End to end scrape benchmark against a local stand-in")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra random seconds, up to this much")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests that fail")
+    parser.add_argument("--new-posts-per-request", type=int, default=2)
+    parser.add_argument("--comments-per-post", type=int, default=20)
+    parser.add_argument("--comment-stream", action="store_true",
+                        help="read comments from each subreddit's comment stream")
+    parser.add_argument("--more-comments-budget", type=int, default=0,
+                        help="morechildren calls allowed per post for truncated comment trees")
+    parser.add_argument("--ratelimit-budget", type=int, default=0,
+                        help="requests the stand-in allows per --ratelimit-window seconds, 0 for no limit")
+    parser.add_argument("--ratelimit-window", type=float, default=600.0)
+    parser.add_argument("--requests-per-second", type=float, default=1000.0,
+                        help="the rate limiter's starting rate, before any X-Ratelimit headers")
+    parser.add_argument("--burst", type=int, default=30, help="requests the rate limiter lets out at once")
+    parser.add_argument("--fixtures", type=Path, help="folder of recorded payloads to replay")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", type=Path, help="also write the report to this file")
+    parser.add_argument("--verbose", action="store_true", help="show the pipeline's own output")
+    args = parser.parse_args()
+
+    config = StandinConfig(
+        latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+        new_posts_per_request=args.new_posts_per_request,
+        comments_per_post=args.comments_per_post, ratelimit_budget=args.ratelimit_budget,
+        ratelimit_window=args.ratelimit_window, fixtures_dir=args.fixtures, seed=args.seed
+    )
+    main.COMMENT_STREAM = args.comment_stream
+    main.MORE_COMMENTS_BUDGET = args.more_comments_budget
+    rate_limiter = RateLimiter(requests_per_second=args.requests_per_second, burst=args.burst)
+    report = run_benchmark(config, args.runs, quiet=not args.verbose, rate_limiter=rate_limiter)
+    print_report(report)
+
+    if args.json:
+        args.json.write_text(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main_cli()
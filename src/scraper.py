@@ -1,10 +1,13 @@
+from collections import deque
 from dataclasses import dataclass
 from pydoc import text
 from typing import Optional
-from db_config import get_db_path
-import re
-import requests
-import sqlite3
+import http_client
+import metrics
+from rate_limiter import RateLimiter
+from seen_window import get_seen_window
+from text_normaliser import normalise_post, normalise_text
+import time
 from typing import Iterator
 
 """
@@ -14,15 +17,28 @@ comments, and returns a ScrapedItem object for each new post and comment found
 
 the sliding window cache synchronizes our database "memory" with the specific depth
 of our Reddit scrape, since we only fetch the n newest posts and m newest comments,
-any item that falls outside that range becomes irrelevant for future checks...when
-a new item is found and recorded, we check if the cache for that specific subreddit
-or post has exceeded our limit, if it has, we delete the oldest entry...this "one-in,
-one-out" approach ensures that if a post/comment is pushed out of our cache, it 
-is because there are now enough newer posts/comments ahead of it that it will never appear
-in our scrape range again, keeping the database lean and preventing redundant processing
+any item that falls outside that range becomes irrelevant for future checks...each
+fetched listing is checked against the in-memory copy of the cache (see
+seen_window.py, it is written back to the post_cache and comment_cache tables once
+per scrape), its new items are recorded together, and the cache for that specific
+subreddit or post is then trimmed back to its newest n entries...this ensures that
+if a post/comment is pushed out of our cache, it is because there are now enough
+newer posts/comments ahead of it that it will never appear in our scrape range
+again, keeping the database lean and preventing redundant processing
 
 the sliding window logic is employed in validate_and_record posts and comments
 functions
+
+listings are fetched incrementally, each subreddit keeps a cursor (the fullname and
+timestamp of the newest post recorded) in the listing_cursors table, and every run
+only asks Reddit for the posts newer than it, paging through as many as there are,
+so quiet subreddits cost one near empty request and busy ones no longer lose the
+posts that scrolled past the first page between runs
+
+comments are either fetched per post, for the newest n posts, or, with
+comment_stream, read from the subreddit wide newest comments listing using the
+same cursor logic, which costs one or two requests per subreddit instead of one
+per post and also sees comments on posts that have left the window
 """
 
 @dataclass
@@ -40,159 +56,341 @@ class Scraper:
     
     # TIMEOUT (in seconds) ensures script is not left hanging waiting for a response
     TIMEOUT = 5
+    
+    # every Reddit endpoint we hit lives on this host, kept separate so concurrent
+    # fetching can apply a per-host cap
+    BASE_URL = "https://www.reddit.com"
+    
+    # items per page when catching up from a cursor, the most Reddit allows
+    LISTING_PAGE_SIZE = 100
+    # pages followed in one run, a subreddit that outpaces this catches up next run
+    MAX_LISTING_PAGES = 10
+    # seconds without a new item after which a listing's cursor is re-checked
+    # against the top of the listing
+    CURSOR_RECHECK_AFTER = 3600
+    # comment ids resolved per morechildren call, the most Reddit allows
+    MORECHILDREN_BATCH = 100
+    # shared by every scraper, paces all Reddit requests to the budget Reddit
+    # reports in its X-Ratelimit headers and retries 429s and 5xx responses with
+    # backoff, the starting rate and burst hold until the first response arrives
+    RATE_LIMITER = RateLimiter(requests_per_second=1.0, burst=30)
 
-    def __init__(self, subreddit: str, post_count: int, comments_count: int):
+    def __init__(self, subreddit: str, post_count: int, comments_count: int,
+                 comment_stream: bool = False, more_comments_budget: int = 0):
         self.__subreddit = subreddit
         self.__post_count = post_count
         self.__comments_count = comments_count
+        self.__comment_stream = comment_stream
+        # morechildren calls allowed per post, 0 leaves "more" objects unexpanded
+        self.__more_comments_budget = more_comments_budget
+        # per post, how many comment ids its page listed including those behind
+        # "more" objects, set by fetch_comments for validate_and_record_comments
+        self.__listed_comments = {}
+        # per comment target, the ids already in its window when the targets were
+        # picked, so expand_more_comments can run on a fetch thread
+        self.__seen_comment_ids = {}
+    
+    @property
+    def comment_stream(self) -> bool:
+        return self.__comment_stream
         
     def scrape_data(self) -> Iterator[ScrapedItem]:
         posts = self.fetch_posts()
-        for post in posts:
-            print(post["id"])
-            
-            # if post is new, we must record it and process its content
-            if self.validate_and_record_posts(post):
-                title_and_body = post["title"] + " " + post["selftext"]
-            
-                # removes URLs to avoid false positives from ticker-like strings within URLs
-                title_and_body = re.sub(r"http\S+|www\S+|https\S+", "", title_and_body)
-                # removes unicode whitespace chars and replaces them with single spaces
-                title_and_body = re.sub(r"\s+", " ", title_and_body)
-
-                yield ScrapedItem(text=title_and_body, post_id=post["id"],
-                                  timestamp=post["created_utc"], 
-                                  subreddit=self.__subreddit
-                )
+        
+        # every new comment of the subreddit in one listing rather than a request
+        # per post
+        if self.__comment_stream:
+            comments = self.fetch_comment_stream()
+            yield from self.process_posts(posts)
+            yield from self.process_comment_stream(comments)
+            return
+        
+        post_ids = self.get_comment_targets(posts)
+        yield from self.process_posts(posts)
+        
+        for post_id in post_ids:
+            print(post_id)
             
             # next, if a comment is new, we must record it and process its content
-            comments = self.fetch_comments(post["id"])
-            for comment in comments:
-                # prevents us from wasting processing on subreddit bot "comments"
-                if comment["author"] == "AutoModerator":
-                    continue
-                
-                if self.validate_and_record_comments(comment, post["id"]):
-                    comment_body = comment["body"]
-                    # removes URLs to avoid false positives from ticker-like strings within URLs
-                    comment_body = re.sub(r"http\S+|www\S+|https\S+", "", comment_body)
-                    # removes unicode whitespace chars and replaces them with single spaces
-                    comment_body = re.sub(r"\s+", " ", comment_body)
-                    
-                    yield ScrapedItem(text=comment_body, post_id=post["id"],
-                                      comment_id=comment["id"],
-                                      timestamp=comment["created_utc"],
-                                      subreddit=self.__subreddit
-                    )
+            comments = self.fetch_comments(post_id)
+            yield from self.process_comments(post_id, comments)
     
-    def fetch_posts(self) -> list:
-        try:
-            params = {"limit": self.__post_count}
-            url = f"https://www.reddit.com/r/{self.__subreddit}/new.json"
+    def process_posts(self, posts: list) -> Iterator[ScrapedItem]:
+        # if a post is new, we must record it and process its content
+        new_posts = self.validate_and_record_posts(posts)
+        # cleaning is timed per item but recorded once per listing
+        cleaning_seconds = 0.0
+        
+        for post in new_posts:
+            start = time.perf_counter()
+            title_and_body = normalise_post(post["title"], post["selftext"])
+            cleaning_seconds += time.perf_counter() - start
+
+            yield ScrapedItem(text=title_and_body, post_id=post["id"],
+                              timestamp=post["created_utc"], 
+                              subreddit=self.__subreddit
+            )
+        
+        metrics.record("clean", cleaning_seconds, len(new_posts), subreddit=self.__subreddit)
+    
+    def process_comment_stream(self, comments: list) -> Iterator[ScrapedItem]:
+        # prevents us from wasting processing on subreddit bot "comments"
+        comments = [comment for comment in comments if comment["author"] != "AutoModerator"]
+        
+        new_comments = self.validate_and_record_stream_comments(comments)
+        cleaning_seconds = 0.0
+        
+        for comment in new_comments:
+            start = time.perf_counter()
+            comment_body = normalise_text(comment["body"])
+            cleaning_seconds += time.perf_counter() - start
             
-            response = requests.get(
-                url, headers=self.HEADERS, params=params, timeout=self.TIMEOUT
+            # link_id is the fullname of the comment's post, "t3_" + its id
+            yield ScrapedItem(text=comment_body, post_id=comment["link_id"][3:],
+                              comment_id=comment["id"],
+                              timestamp=comment["created_utc"],
+                              subreddit=self.__subreddit
             )
-            # raises an HTTPError if the response was unsuccessful (400 or 500 codes)
-            response.raise_for_status()
-            response_json = response.json()
+        
+        metrics.record("clean", cleaning_seconds, len(new_comments), subreddit=self.__subreddit)
+    
+    def process_comments(self, post_id: str, comments: list) -> Iterator[ScrapedItem]:
+        # prevents us from wasting processing on subreddit bot "comments"
+        comments = [comment for comment in comments if comment["author"] != "AutoModerator"]
+        
+        new_comments = self.validate_and_record_comments(comments, post_id)
+        cleaning_seconds = 0.0
+        
+        for comment in new_comments:
+            start = time.perf_counter()
+            comment_body = normalise_text(comment["body"])
+            cleaning_seconds += time.perf_counter() - start
             
-            posts = response_json["data"]["children"]
-            # removes the need to access "data" with each post
-            posts = [post["data"] for post in posts]
+            yield ScrapedItem(text=comment_body, post_id=post_id,
+                              comment_id=comment["id"],
+                              timestamp=comment["created_utc"],
+                              subreddit=self.__subreddit
+            )
+        
+        metrics.record("clean", cleaning_seconds, len(new_comments), subreddit=self.__subreddit)
+    
+    def fetch_posts(self) -> list:
+        '''
+        returns the posts made since the last run, newest first...the first run of a
+        subreddit (no cursor yet) takes the newest post_count posts, every later run
+        asks only for posts newer than the subreddit's cursor, following as many
+        pages as that takes
+        '''
+        try:
+            posts = self.fetch_since_cursor("new", self.__post_count)
             
             if posts:
-                print(f"\nSuccessfully fetched posts from {self.__subreddit}:")
+                print(f"\nSuccessfully fetched {len(posts)} new posts from {self.__subreddit}:")
 
             return posts
         
         except Exception as e:
             print(f"FATAL ERROR: Failed to fetch posts from r/{self.__subreddit}: {e}")
             raise
-
-    def validate_and_record_posts(self, post: dict) -> bool:        
-        # ensures we don't get an UnboundLocalError in the except block
-        connection = None
-        
+    
+    def fetch_comment_stream(self) -> list:
+        '''
+        returns the comments made on any post of the subreddit since the last run,
+        newest first, from the subreddit wide comments listing...the same cursor
+        logic as fetch_posts, the first run takes a single page
+        '''
         try:
-            post_id = post["id"]
-            connection = sqlite3.connect(get_db_path())
-            cursor = connection.cursor()
+            comments = self.fetch_since_cursor("comments", self.LISTING_PAGE_SIZE)
+            
+            if comments:
+                print(f"Successfully fetched {len(comments)} new comments from {self.__subreddit}")
+            
+            return comments
         
-            cursor.execute(
-                '''SELECT post_id FROM post_cache WHERE post_id = ?''',
-                (post_id,)
+        except Exception as e:
+            print(f"FATAL ERROR: Failed to fetch comment stream of r/{self.__subreddit}: {e}")
+            raise
+    
+    def fetch_since_cursor(self, listing: str, first_page_size: int) -> list:
+        cursor = self.read_cursor(listing)
+        if cursor is None:
+            return self.fetch_listing(listing, {"limit": first_page_size})
+        
+        newest_fullname, newest_timestamp, checked_at = cursor
+        items = self.fetch_before(listing, newest_fullname)
+        
+        # a cursor item that was removed or deleted makes before= return nothing
+        # forever, so a quiet listing is periodically re-checked from the top
+        # instead
+        if not items and time.time() - checked_at > self.CURSOR_RECHECK_AFTER:
+            items = self.fetch_newer_than(listing, newest_timestamp)
+            self.mark_cursor_checked(listing)
+        
+        return items
+    
+    def fetch_before(self, listing: str, fullname: str) -> list:
+        # before= returns the page of items directly newer than fullname, so each
+        # following page starts from the newest item of the last one
+        items = []
+        for _ in range(self.MAX_LISTING_PAGES):
+            page = self.fetch_listing(listing, {"limit": self.LISTING_PAGE_SIZE, "before": fullname})
+            items = page + items
+            if len(page) < self.LISTING_PAGE_SIZE:
+                return items
+            fullname = page[0]["name"]
+        
+        # nothing is lost, the cursor stops at the newest item we got and the next
+        # run carries on from there
+        print(
+            f"NON-FATAL ERROR: r/{self.__subreddit} {listing} has more than "
+            f"{self.MAX_LISTING_PAGES * self.LISTING_PAGE_SIZE} new items, the rest "
+            "will be fetched next run."
+        )
+        return items
+    
+    def fetch_newer_than(self, listing: str, newest_timestamp: float) -> list:
+        # walks back from the top of the listing until it reaches items we have seen
+        items = []
+        params = {"limit": self.LISTING_PAGE_SIZE}
+        for _ in range(self.MAX_LISTING_PAGES):
+            page = self.fetch_listing(listing, params)
+            newer = [item for item in page if item["created_utc"] > newest_timestamp]
+            items.extend(newer)
+            if len(newer) < len(page) or len(page) < self.LISTING_PAGE_SIZE:
+                break
+            params = {"limit": self.LISTING_PAGE_SIZE, "after": page[-1]["name"]}
+        
+        return items
+    
+    def fetch_listing(self, listing: str, params: dict) -> list:
+        # "new" is the newest posts of the subreddit, "comments" its newest comments
+        endpoint = "listing" if listing == "new" else "comment_stream"
+        
+        with metrics.timed("fetch", endpoint=endpoint, subreddit=self.__subreddit) as timer:
+            url = f"{self.BASE_URL}/r/{self.__subreddit}/{listing}.json"
+            
+            response = http_client.get(
+                url, headers=self.HEADERS, params=params, timeout=self.TIMEOUT,
+                rate_limiter=self.RATE_LIMITER
             )
-            cursor_result = cursor.fetchone()
-            is_new = cursor_result is None
+            # raises an HTTPError if the response was unsuccessful (400 or 500 codes)
+            response.raise_for_status()
+            response_json = response.json()
             
-            if is_new:
-                # insert the new post
-                cursor.execute(
-                    '''INSERT INTO post_cache (post_id, post_timestamp, subreddit)
-                    VALUES (?, ?, ?)''',
-                    (post_id, post["created_utc"], self.__subreddit)
-                )
+            items = response_json["data"]["children"]
+            # removes the need to access "data" with each item
+            items = [item["data"] for item in items]
+            timer.items = len(items)
+            timer.bytes = len(response.content)
+            
+            return items
+    
+    def read_cursor(self, listing: str):
+        '''
+        returns (newest_fullname, newest_timestamp, checked_at) for one of the
+        subreddit's listings, or None before its first scrape
+        '''
+        return get_seen_window().read_cursor(self.__subreddit, listing)
+    
+    def save_cursor(self, listing: str, items: list):
+        '''
+        moves the listing's cursor up to the newest of items, it is checkpointed
+        together with the items it covers
+        '''
+        newest_item = max(items, key=lambda item: item["created_utc"])
+        get_seen_window().save_cursor(
+            self.__subreddit, listing, newest_item["name"], newest_item["created_utc"],
+            time.time()
+        )
+    
+    def mark_cursor_checked(self, listing: str):
+        get_seen_window().mark_cursor_checked(self.__subreddit, listing, time.time())
+    
+    def get_comment_targets(self, new_posts: list) -> list[str]:
+        '''
+        ids of the post_count newest posts of the subreddit, the ones already in
+        the post cache together with those just fetched...fetch_posts only returns
+        new posts, but the comments of older posts in the window keep coming in
+        '''
+        seen_window = get_seen_window()
+        newest = seen_window.newest_posts(self.__subreddit, self.__post_count)
+        newest.update((post["id"], post["created_utc"]) for post in new_posts)
+        post_ids = sorted(newest, key=newest.get, reverse=True)[:self.__post_count]
+        
+        if self.__more_comments_budget:
+            self.__seen_comment_ids = seen_window.seen_comment_ids(self.__subreddit, post_ids)
+        
+        return post_ids
 
-                # check if we have more than n (desired post_count) entries in the db
-                # for the relevant subreddit
-                cursor.execute('''
-                    SELECT COUNT(*) FROM post_cache WHERE subreddit = ?''',
-                    (self.__subreddit,)
+    def validate_and_record_posts(self, posts: list) -> list:
+        '''
+        checks a whole listing against the subreddit's post window, records every
+        new post, trims the window back to the newest n posts and moves the
+        subreddit's cursor up to the newest post, returning only the posts that
+        were new...all of it in memory, see seen_window.py for when it is written
+        '''
+        if not posts:
+            return []
+        
+        try:
+            with metrics.timed("cache_dedup", kind="posts", subreddit=self.__subreddit) as timer:
+                # a listing can repeat a post if it shifted between pages
+                posts = list({post["id"]: post for post in posts}.values())
+                timer.items = len(posts)
+            
+                # keep only the n (desired post_count) newest posts of the subreddit
+                new_posts = get_seen_window().record_posts(
+                    self.__subreddit, posts, self.__post_count
                 )
-                current_post_count = cursor.fetchone()[0]
-                print(f"Post cache count in {self.__subreddit} exceeded {self.__post_count} with {current_post_count} posts.", end=" ")
-
-                if current_post_count > self.__post_count:
-                    # delete the post with the smallest (oldest) timestamp
-                    cursor.execute('''
-                        DELETE FROM post_cache 
-                        WHERE subreddit = ? AND
-                        post_timestamp = (
-                            SELECT MIN(post_timestamp) FROM post_cache
-                            WHERE subreddit = ?)''', 
-                        (self.__subreddit, self.__subreddit)
-                    )
-                    print(f"Post deleted from post cache.")
-                
-                connection.commit()
+                # written even when nothing was new, so a database from before
+                # cursors existed gets one on its first run
+                self.save_cursor("new", posts)
             
-            return is_new
+                return new_posts
         
         except Exception as e:
             print(
-                f"FATAL ERROR: Failed to validate/record post {post_id} "
+                f"FATAL ERROR: Failed to validate/record posts "
                 f"in r/{self.__subreddit}: {e}"
             )
-            if connection:
-                connection.rollback()
             raise
-        
-        finally:
-            if connection:
-                connection.close()
     
     def fetch_comments(self, post_id: str) -> list:
         try:
-            params = {"limit": self.__comments_count}
-            # targets the newest comments on the post but reddit paginates comments 
-            # and inserts "more" objects after a nondescript amounts of comments, this
-            # means we may not get the comments_count amount of comments...limit, depth,
-            # and context parameters do not help with this
-            url = f"https://www.reddit.com/r/{self.__subreddit}/comments/{post_id}/.json?sort=new&depth=1"
+            with metrics.timed("fetch", endpoint="comments", subreddit=self.__subreddit) as timer:
+                params = {"limit": self.__comments_count}
+                # targets the newest comments on the post but reddit paginates comments 
+                # and inserts "more" objects after a nondescript amounts of comments, this
+                # means we may not get the comments_count amount of comments...limit, depth,
+                # and context parameters do not help with this, more_comments_budget
+                # (see expand_more_comments) does
+                url = f"{self.BASE_URL}/r/{self.__subreddit}/comments/{post_id}/.json?sort=new&depth=1"
             
-            response = requests.get(
-                url, headers=self.HEADERS, params=params, timeout=self.TIMEOUT
-            )
-            # raises an HTTPError if the response was unsuccessful (400 or 500 codes)
-            response.raise_for_status()
-            response_json = response.json()
+                response = http_client.get(
+                    url, headers=self.HEADERS, params=params, timeout=self.TIMEOUT,
+                    rate_limiter=self.RATE_LIMITER
+                )
+                # raises an HTTPError if the response was unsuccessful (400 or 500 codes)
+                response.raise_for_status()
+                response_json = response.json()
             
-            comments = response_json[1]["data"]["children"]
+                comments = response_json[1]["data"]["children"]
 
-            # kind == t1 filters out "more" objects to ensure we only access 
-            # actual comments
-            actual_comments = [comm["data"] for comm in comments if comm["kind"] == "t1"]
+                # kind == t1 filters out "more" objects to ensure we only access 
+                # actual comments
+                actual_comments = [comm["data"] for comm in comments if comm["kind"] == "t1"]
+                timer.items = len(actual_comments)
+                timer.bytes = len(response.content)
+            
+            # the ids hidden behind "more" objects can be resolved in batches, within
+            # the post's request budget
+            if self.__more_comments_budget:
+                more_ids = [
+                    child_id for comm in comments if comm["kind"] == "more"
+                    for child_id in comm["data"]["children"]
+                ]
+                self.__listed_comments[post_id] = len(actual_comments) + len(more_ids)
+                actual_comments += self.expand_more_comments(post_id, more_ids)
             
             if actual_comments:
                 print(f"Successfully fetched comments from post {post_id} in {self.__subreddit}")
@@ -206,60 +404,129 @@ class Scraper:
             )
             raise
         
-    def validate_and_record_comments(self, comment: dict, post_id: str) -> bool:
-        #ensures we don't get an UnboundLocalError in the except block 
-        connection = None
+    def expand_more_comments(self, post_id: str, more_ids: list[str]) -> list:
+        '''
+        resolves the comment ids of "more" objects with morechildren calls of up to
+        MORECHILDREN_BATCH ids each, at most more_comments_budget calls per post...
+        the "more" objects those calls return are queued up in turn, ids already in
+        the post's comment window (as of get_comment_targets) are never requested
+        again...runs on the fetch threads of a concurrent scrape, so it must not
+        touch the seen window or the database
         
-        try:
-            comment_id = comment["id"]
-            connection = sqlite3.connect(get_db_path())
-            cursor = connection.cursor()
+        expansion only adds to what the comment page already gave us, so a failed
+        call keeps the comments resolved so far instead of failing the post
+        '''
+        seen_ids = self.__seen_comment_ids.get(post_id, frozenset())
+        pending = deque(comment_id for comment_id in more_ids if comment_id not in seen_ids)
+        expanded = []
+        
+        for _ in range(self.__more_comments_budget):
+            if not pending:
+                break
+            batch = [pending.popleft() for _ in range(min(self.MORECHILDREN_BATCH, len(pending)))]
+            
+            try:
+                things = self.fetch_more_children(post_id, batch)
             
-            cursor.execute(
-                '''SELECT 1 FROM comment_cache WHERE comment_id = ? AND post_id = ?''', 
-                (comment_id, post_id)
+            except Exception as e:
+                print(
+                    f"NON-FATAL ERROR: Failed to expand more comments for post {post_id} "
+                    f"in r/{self.__subreddit}: {e}"
+                )
+                break
+            
+            for thing in things:
+                if thing["kind"] == "t1":
+                    expanded.append(thing["data"])
+                elif thing["kind"] == "more":
+                    pending.extend(
+                        comment_id for comment_id in thing["data"]["children"]
+                        if comment_id not in seen_ids
+                    )
+        
+        if pending:
+            print(f"{len(pending)} comment(s) of post {post_id} left unexpanded, budget reached.")
+        
+        return expanded
+    
+    def fetch_more_children(self, post_id: str, comment_ids: list[str]) -> list:
+        with metrics.timed("fetch", endpoint="morechildren", subreddit=self.__subreddit) as timer:
+            params = {
+                "api_type": "json", "link_id": f"t3_{post_id}", "children": ",".join(comment_ids),
+                "sort": "new", "limit_children": "false",
+            }
+            
+            response = http_client.get(
+                f"{self.BASE_URL}/api/morechildren.json", headers=self.HEADERS,
+                params=params, timeout=self.TIMEOUT, rate_limiter=self.RATE_LIMITER
             )
-            cursor_result = cursor.fetchone()
-            is_new = cursor_result is None
-
-            if is_new:
-                cursor.execute(
-                    '''INSERT INTO comment_cache (comment_id, post_id, 
-                    comment_timestamp, subreddit) VALUES (?, ?, ?, ?)''',
-                    (comment_id, post_id, comment["created_utc"], self.__subreddit)
+            response.raise_for_status()
+            
+            things = response.json()["json"]["data"]["things"]
+            timer.items = len(things)
+            timer.bytes = len(response.content)
+            
+            return things
+    
+    def validate_and_record_comments(self, comments: list, post_id: str) -> list:
+        '''
+        same check, record and trim as validate_and_record_posts, but against the
+        comment window of a single post
+        '''
+        if not comments:
+            return []
+        
+        try:
+            with metrics.timed("cache_dedup", kind="comments", subreddit=self.__subreddit) as timer:
+                comments = list({comment["id"]: comment for comment in comments}.values())
+                timer.items = len(comments)
+            
+                # keep only the m (desired comments_count) newest comments of the
+                # post, or, when "more" objects are expanded, as many as the post's
+                # page listed, otherwise those beyond m would be taken for new ones
+                # again on the next run and expanded all over again
+                keep = max(
+                    self.__comments_count, len(comments),
+                    self.__listed_comments.pop(post_id, 0)
                 )
-                
-                cursor.execute(
-                    '''SELECT COUNT(*) FROM comment_cache WHERE post_id = ?''',
-                    (post_id,)
+                return get_seen_window().record_comments(
+                    self.__subreddit, comments, keep, post_id
                 )
-                current_comment_count = cursor.fetchone()[0]
-
-                if current_comment_count > self.__comments_count:
-                    # delete the comment with the smallest (oldest) timestamp
-                    cursor.execute(
-                        '''DELETE FROM comment_cache WHERE post_id = ? 
-                        AND comment_timestamp = (SELECT MIN(comment_timestamp) 
-                        FROM comment_cache WHERE post_id = ?)''',
-                        (post_id, post_id)
-                    )
-
-                connection.commit()
-
-            return is_new
     
         except Exception as e:
             print(
-                f"FATAL ERROR: Failed to validate/record comment {comment_id} "
+                f"FATAL ERROR: Failed to validate/record comments "
                 f"for post {post_id} in r/{self.__subreddit}: {e}"
             )
-            if connection:
-                connection.rollback()
             raise
+
+    def validate_and_record_stream_comments(self, comments: list) -> list:
+        '''
+        the check and record of validate_and_record_comments for comments spanning
+        many posts, every touched post's window is trimmed back to its m newest
+        comments and the comment stream cursor moved
+        '''
+        if not comments:
+            return []
         
-        finally:
-            if connection:
-                connection.close()
+        try:
+            with metrics.timed("cache_dedup", kind="comment_stream", subreddit=self.__subreddit) as timer:
+                comments = list({comment["id"]: comment for comment in comments}.values())
+                timer.items = len(comments)
+                
+                new_comments = get_seen_window().record_comments(
+                    self.__subreddit, comments, self.__comments_count
+                )
+                self.save_cursor("comments", comments)
+                
+                return new_comments
+        
+        except Exception as e:
+            print(
+                f"FATAL ERROR: Failed to validate/record comment stream "
+                f"of r/{self.__subreddit}: {e}"
+            )
+            raise
 
 if __name__ == "__main__":
     scraper = Scraper("stocks", 10, 6)
@@ -0,0 +1,104 @@
+import hashlib
+import math
+import time
+
+"""
+a rotating Bloom filter of the posts and comments a subreddit has already had
+processed, covering weeks rather than the few newest items the sliding window
+cache holds, so a post or comment that re-surfaces after falling out of the
+window (see README, section Post Reprocessing Issue) is recognised and skipped
+before it is cleaned, extracted or written
+
+the filter is a ring of GENERATIONS Bloom filters, items are added to the newest
+and looked up in all of them...a new generation is started every ROTATION_PERIOD
+seconds, or early once the newest holds CAPACITY items so the false positive rate
+never drifts above what it was sized for, and the oldest is dropped, which bounds
+memory at GENERATIONS filters per subreddit however long the scheduler runs
+
+a false positive is a genuinely new item skipped, FALSE_POSITIVE_RATE is the
+chance of that for any one item across all generations, there are no false
+negatives...the generations are stored in the seen_filters table, see
+seen_window.py for when
+"""
+
+GENERATIONS = 4
+ROTATION_PERIOD = 7 * 24 * 60 * 60  # seconds, so the filter covers 3 to 4 weeks
+# items per generation per subreddit, about 150KB each at the default rate
+CAPACITY = 50000
+FALSE_POSITIVE_RATE = 0.0001
+
+def filter_size(capacity: int, false_positive_rate: float) -> tuple[int, int]:
+    '''
+    the number of bits and hash functions of a Bloom filter holding capacity
+    items at false_positive_rate
+    '''
+    bit_count = math.ceil(-capacity * math.log(false_positive_rate) / math.log(2) ** 2)
+    hash_count = max(round(bit_count / capacity * math.log(2)), 1)
+
+    return bit_count, hash_count
+
+class BloomFilter:
+    __slots__ = ("bits", "bit_count", "hash_count", "item_count", "started_at")
+
+    def __init__(self, bit_count: int, hash_count: int, started_at: float,
+                 bits: bytearray = None, item_count: int = 0):
+        self.bits = bits if bits is not None else bytearray((bit_count + 7) // 8)
+        self.bit_count = len(self.bits) * 8
+        self.hash_count = hash_count
+        self.item_count = item_count
+        self.started_at = started_at
+
+    def positions(self, key: str):
+        # double hashing, two 64 bit halves of one digest stand in for k hashes
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+
+        return [(first + index * second) % self.bit_count for index in range(self.hash_count)]
+
+    def __contains__(self, key: str) -> bool:
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self.positions(key))
+
+    def add(self, key: str) -> bool:
+        '''
+        returns whether the key was new to the filter (as far as it can tell)
+        '''
+        added = False
+        for position in self.positions(key):
+            mask = 1 << (position & 7)
+            if not self.bits[position >> 3] & mask:
+                self.bits[position >> 3] |= mask
+                added = True
+
+        if added:
+            self.item_count += 1
+
+        return added
+
+class SeenFilter:
+    """
+    the generations of one subreddit, newest last
+    """
+    def __init__(self, generations: list[BloomFilter] = None):
+        self.generations = generations or []
+
+    def __contains__(self, key: str) -> bool:
+        return any(key in generation for generation in self.generations)
+
+    def add(self, key: str, now: float = None) -> bool:
+        '''
+        adds key to the newest generation, rotating first if it is due, returns
+        whether anything changed
+        '''
+        now = time.time() if now is None else now
+        newest = self.generations[-1] if self.generations else None
+
+        if (newest is None or newest.item_count >= CAPACITY
+                or now - newest.started_at >= ROTATION_PERIOD):
+            # every generation gets its share of the overall false positive rate
+            bit_count, hash_count = filter_size(CAPACITY, FALSE_POSITIVE_RATE / GENERATIONS)
+            self.generations.append(BloomFilter(bit_count, hash_count, now))
+            del self.generations[:-GENERATIONS]
+
+        return self.generations[-1].add(key)
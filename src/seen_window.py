@@ -0,0 +1,439 @@
+from bisect import insort
+from collections import OrderedDict
+from db_config import get_connection
+import metrics
+from seen_filter import BloomFilter, SeenFilter
+import threading
+
+"""
+a process-resident copy of the sliding window caches (post_cache, comment_cache)
+and of the listing cursors, so deciding whether a fetched post or comment is new
+is a set lookup instead of a database round trip
+
+each subreddit's post window and each post's comment window is a hash set of ids
+next to a list of (timestamp, id) kept in timestamp order, adding to a window and
+trimming it back to its newest n entries mirror the INSERT and DELETE the scraper
+used to run against the tables...the tables stay the source of truth, they are
+read once when the window is first used and every change since is written back
+by checkpoint() in a single transaction at the end of each scrape, after its
+mentions are recorded, so a scrape that fails never leaves its items marked as
+seen (reset_seen_window() drops the memory and the next scrape reloads)
+
+only the comment windows of the MAX_COMMENT_WINDOWS most recently used posts are
+kept in memory, the windows of older posts are loaded from comment_cache again,
+in one query per listing, if their post ever comes back
+
+an item missing from its window is also checked against the subreddit's rotating
+Bloom filter (seen_filter.py), which remembers weeks of processed items, one
+found there re-surfaced after leaving the window, it goes back into the window
+but is not returned as new...the filters are checkpointed with the windows
+"""
+
+# per-post comment windows held in memory, the least recently used are dropped
+# (after being checkpointed) beyond this
+MAX_COMMENT_WINDOWS = 5000
+
+_seen_window = None
+_seen_window_lock = threading.Lock()
+
+class Window:
+    """
+    the ids of one subreddit's cached posts or one post's cached comments
+    """
+    __slots__ = ("ids", "order")
+
+    def __init__(self):
+        self.ids = set()
+        # (timestamp, id) oldest first, the ids trimmed away come off the front
+        self.order = []
+
+    def add(self, item_id: str, timestamp: float):
+        self.ids.add(item_id)
+        insort(self.order, (timestamp, item_id))
+
+    def trim(self, keep: int) -> list[str]:
+        '''
+        drops all but the keep newest ids, returns the ids dropped
+        '''
+        excess = len(self.order) - keep
+        if excess <= 0:
+            return []
+
+        dropped = [item_id for _, item_id in self.order[:excess]]
+        del self.order[:excess]
+        self.ids.difference_update(dropped)
+
+        return dropped
+
+class SeenWindow:
+    """
+    every method is safe to call from any thread, the scraper validates on the
+    calling thread but reads cursors from its fetch threads
+    """
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__post_windows = {}
+        # post id -> (subreddit, Window), in least to most recently used order
+        self.__comment_windows = OrderedDict()
+        # (subreddit, listing) -> [newest_fullname, newest_timestamp, checked_at]
+        self.__cursors = {}
+
+        # changes since the last checkpoint, keyed by the tables' primary keys
+        self.__post_inserts = {}
+        self.__post_deletes = set()
+        self.__comment_inserts = {}
+        self.__comment_deletes = set()
+        self.__dirty_cursors = set()
+
+        # subreddit -> SeenFilter, and the (subreddit, started_at) generations
+        # changed since the last checkpoint
+        self.__filters = {}
+        self.__dirty_generations = set()
+
+        self.__load()
+
+    def __load(self):
+        cursor = get_connection().cursor()
+
+        cursor.execute("SELECT post_id, post_timestamp, subreddit FROM post_cache")
+        for post_id, timestamp, subreddit in cursor.fetchall():
+            self.__post_windows.setdefault(subreddit, Window()).add(post_id, timestamp)
+
+        # the comment windows of the posts that most recently received comments,
+        # oldest first so the newest end up most recently used
+        cursor.execute(
+            '''SELECT comment_id, post_id, comment_timestamp, subreddit FROM comment_cache
+            WHERE post_id IN (
+                SELECT post_id FROM comment_cache GROUP BY post_id
+                ORDER BY MAX(comment_timestamp) DESC LIMIT ?)
+            ORDER BY comment_timestamp''',
+            (MAX_COMMENT_WINDOWS,)
+        )
+        for comment_id, post_id, timestamp, subreddit in cursor.fetchall():
+            self.__comment_window(post_id, subreddit).add(comment_id, timestamp)
+
+        cursor.execute(
+            '''SELECT subreddit, listing, newest_fullname, newest_timestamp, checked_at
+            FROM listing_cursors'''
+        )
+        for subreddit, listing, *cursor_values in cursor.fetchall():
+            self.__cursors[(subreddit, listing)] = cursor_values
+
+        cursor.execute(
+            '''SELECT subreddit, started_at, item_count, hash_count, bits FROM seen_filters
+            ORDER BY started_at'''
+        )
+        for subreddit, started_at, item_count, hash_count, bits in cursor.fetchall():
+            self.__filters.setdefault(subreddit, SeenFilter()).generations.append(
+                BloomFilter(0, hash_count, started_at, bytearray(bits), item_count)
+            )
+
+        # everything in the windows has been processed, this only adds anything
+        # the first time, for the items recorded before the filters existed
+        for subreddit, window in self.__post_windows.items():
+            for post_id in window.ids:
+                self.__remember(subreddit, f"t3_{post_id}")
+        for subreddit, window in self.__comment_windows.values():
+            for comment_id in window.ids:
+                self.__remember(subreddit, f"t1_{comment_id}")
+
+    def __remember(self, subreddit: str, fullname: str):
+        seen_filter = self.__filters.get(subreddit)
+        if seen_filter is None:
+            seen_filter = self.__filters[subreddit] = SeenFilter()
+        elif fullname in seen_filter:
+            return
+
+        if seen_filter.add(fullname):
+            self.__dirty_generations.add((subreddit, seen_filter.generations[-1].started_at))
+
+    def __resurfaced(self, subreddit: str, fullname: str) -> bool:
+        seen_filter = self.__filters.get(subreddit)
+        return seen_filter is not None and fullname in seen_filter
+
+    def __comment_window(self, post_id: str, subreddit: str) -> Window:
+        entry = self.__comment_windows.get(post_id)
+        if entry is None:
+            entry = self.__comment_windows[post_id] = (subreddit, Window())
+        else:
+            self.__comment_windows.move_to_end(post_id)
+
+        return entry[1]
+
+    def __load_comment_windows(self, post_ids: set, subreddit: str):
+        # posts whose window was dropped from memory, or that never had one
+        missing_ids = [post_id for post_id in post_ids if post_id not in self.__comment_windows]
+        if not missing_ids:
+            return
+
+        for post_id in missing_ids:
+            self.__comment_window(post_id, subreddit)
+
+        cursor = get_connection().cursor()
+        placeholders = ", ".join("?" * len(missing_ids))
+        cursor.execute(
+            f'''SELECT comment_id, post_id, comment_timestamp FROM comment_cache
+            WHERE post_id IN ({placeholders})''',
+            missing_ids
+        )
+        for comment_id, post_id, timestamp in cursor.fetchall():
+            self.__comment_windows[post_id][1].add(comment_id, timestamp)
+
+    def record_posts(self, subreddit: str, posts: list, keep: int) -> list:
+        '''
+        adds the posts not in the subreddit's window and trims it back to its keep
+        newest posts, returns the posts that were new
+        '''
+        with self.__lock:
+            window = self.__post_windows.setdefault(subreddit, Window())
+            new_posts = []
+            resurfaced = 0
+
+            for post in posts:
+                if post["id"] in window.ids:
+                    continue
+
+                window.add(post["id"], post["created_utc"])
+                self.__post_deletes.discard(post["id"])
+                self.__post_inserts[post["id"]] = (post["id"], post["created_utc"], subreddit)
+
+                if self.__resurfaced(subreddit, f"t3_{post['id']}"):
+                    resurfaced += 1
+                else:
+                    self.__remember(subreddit, f"t3_{post['id']}")
+                    new_posts.append(post)
+
+            for post_id in window.trim(keep):
+                # never written, nothing to delete
+                if self.__post_inserts.pop(post_id, None) is None:
+                    self.__post_deletes.add(post_id)
+
+        if resurfaced:
+            metrics.record("resurfaced", items=resurfaced, kind="posts", subreddit=subreddit)
+
+        return new_posts
+
+    def record_comments(self, subreddit: str, comments: list, keep: int,
+                        post_id: str = None) -> list:
+        '''
+        adds the comments not in their post's window and trims every post that
+        received some back to its keep newest comments, returns the comments that
+        were new...comments of a single post pass its post_id, otherwise each
+        comment's post is read from its link_id
+        '''
+        def post_of(comment) -> str:
+            # link_id is the fullname of the comment's post, "t3_" + its id
+            return post_id or comment["link_id"][3:]
+
+        with self.__lock:
+            self.__load_comment_windows({post_of(comment) for comment in comments}, subreddit)
+
+            new_comments = []
+            resurfaced = 0
+            touched_posts = set()
+            for comment in comments:
+                comment_post_id = post_of(comment)
+                window = self.__comment_window(comment_post_id, subreddit)
+                if comment["id"] in window.ids:
+                    continue
+
+                key = (comment["id"], comment_post_id)
+                window.add(comment["id"], comment["created_utc"])
+                self.__comment_deletes.discard(key)
+                self.__comment_inserts[key] = (*key, comment["created_utc"], subreddit)
+                touched_posts.add(comment_post_id)
+
+                if self.__resurfaced(subreddit, f"t1_{comment['id']}"):
+                    resurfaced += 1
+                else:
+                    self.__remember(subreddit, f"t1_{comment['id']}")
+                    new_comments.append(comment)
+
+            for touched_post_id in touched_posts:
+                for comment_id in self.__comment_windows[touched_post_id][1].trim(keep):
+                    key = (comment_id, touched_post_id)
+                    if self.__comment_inserts.pop(key, None) is None:
+                        self.__comment_deletes.add(key)
+
+        if resurfaced:
+            metrics.record("resurfaced", items=resurfaced, kind="comments", subreddit=subreddit)
+
+        return new_comments
+
+    def seen_comment_ids(self, subreddit: str, post_ids: list) -> dict[str, frozenset]:
+        '''
+        a snapshot of the comment ids in each post's window, loaded together...taken
+        on the scraping thread so the fetch threads never touch the window or the
+        database
+        '''
+        with self.__lock:
+            self.__load_comment_windows(set(post_ids), subreddit)
+
+            return {
+                post_id: frozenset(self.__comment_window(post_id, subreddit).ids)
+                for post_id in post_ids
+            }
+
+    def newest_posts(self, subreddit: str, count: int) -> dict[str, float]:
+        '''
+        id -> timestamp of the subreddit's count newest cached posts
+        '''
+        with self.__lock:
+            window = self.__post_windows.get(subreddit)
+            if window is None or not count:
+                return {}
+
+            return {item_id: timestamp for timestamp, item_id in window.order[-count:]}
+
+    def read_cursor(self, subreddit: str, listing: str):
+        with self.__lock:
+            cursor = self.__cursors.get((subreddit, listing))
+            return tuple(cursor) if cursor else None
+
+    def save_cursor(self, subreddit: str, listing: str, fullname: str, timestamp: float,
+                    checked_at: float):
+        with self.__lock:
+            cursor = self.__cursors.get((subreddit, listing))
+            # only ever forward, a late page must not move the cursor back
+            if cursor is not None and timestamp <= cursor[1]:
+                return
+            self.__cursors[(subreddit, listing)] = [fullname, timestamp, checked_at]
+            self.__dirty_cursors.add((subreddit, listing))
+
+    def mark_cursor_checked(self, subreddit: str, listing: str, checked_at: float):
+        with self.__lock:
+            cursor = self.__cursors.get((subreddit, listing))
+            if cursor is not None:
+                cursor[2] = checked_at
+                self.__dirty_cursors.add((subreddit, listing))
+
+    def checkpoint(self) -> int:
+        '''
+        writes every change since the last checkpoint in one transaction and drops
+        the least recently used comment windows beyond MAX_COMMENT_WINDOWS, returns
+        the number of rows written
+        '''
+        with self.__lock:
+            connection = get_connection()
+            cursor = connection.cursor()
+
+            try:
+                cursor.executemany(
+                    "DELETE FROM post_cache WHERE post_id = ?",
+                    [(post_id,) for post_id in self.__post_deletes]
+                )
+                cursor.executemany(
+                    '''INSERT OR REPLACE INTO post_cache (post_id, post_timestamp, subreddit)
+                    VALUES (?, ?, ?)''',
+                    self.__post_inserts.values()
+                )
+                cursor.executemany(
+                    "DELETE FROM comment_cache WHERE comment_id = ? AND post_id = ?",
+                    self.__comment_deletes
+                )
+                cursor.executemany(
+                    '''INSERT OR REPLACE INTO comment_cache (comment_id, post_id,
+                    comment_timestamp, subreddit) VALUES (?, ?, ?, ?)''',
+                    self.__comment_inserts.values()
+                )
+                cursor.executemany(
+                    '''INSERT INTO listing_cursors (subreddit, listing, newest_fullname,
+                    newest_timestamp, checked_at) VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT (subreddit, listing) DO UPDATE SET
+                        newest_fullname = excluded.newest_fullname,
+                        newest_timestamp = excluded.newest_timestamp,
+                        checked_at = excluded.checked_at''',
+                    [(*key, *self.__cursors[key]) for key in self.__dirty_cursors]
+                )
+                self.__write_filters(cursor)
+                connection.commit()
+
+            except Exception as e:
+                print(f"FATAL ERROR: Failed to checkpoint the seen window: {e}")
+                connection.rollback()
+                raise
+
+            written = (
+                len(self.__post_deletes) + len(self.__post_inserts) + len(self.__comment_deletes)
+                + len(self.__comment_inserts) + len(self.__dirty_cursors)
+                + len(self.__dirty_generations)
+            )
+            for pending in (self.__post_inserts, self.__post_deletes, self.__comment_inserts,
+                            self.__comment_deletes, self.__dirty_cursors,
+                            self.__dirty_generations):
+                pending.clear()
+
+            while len(self.__comment_windows) > MAX_COMMENT_WINDOWS:
+                self.__comment_windows.popitem(last=False)
+
+            return written
+
+    def __write_filters(self, cursor):
+        rows = []
+        for subreddit in {subreddit for subreddit, _ in self.__dirty_generations}:
+            generations = self.__filters[subreddit].generations
+            # drops the generations rotated out since the last checkpoint
+            placeholders = ", ".join("?" * len(generations))
+            cursor.execute(
+                f'''DELETE FROM seen_filters WHERE subreddit = ?
+                AND started_at NOT IN ({placeholders})''',
+                [subreddit, *(generation.started_at for generation in generations)]
+            )
+
+            rows.extend(
+                (subreddit, generation.started_at, generation.item_count,
+                 generation.hash_count, bytes(generation.bits))
+                for generation in generations
+                if (subreddit, generation.started_at) in self.__dirty_generations
+            )
+
+        cursor.executemany(
+            '''INSERT OR REPLACE INTO seen_filters (subreddit, started_at, item_count,
+            hash_count, bits) VALUES (?, ?, ?, ?, ?)''',
+            rows
+        )
+
+    def discard_subreddit(self, subreddit: str):
+        '''
+        forgets the subreddit's windows, cursors and pending changes without
+        writing them, for callers that delete its rows from the tables themselves
+        '''
+        with self.__lock:
+            self.__post_windows.pop(subreddit, None)
+            self.__filters.pop(subreddit, None)
+            self.__dirty_generations = {
+                key for key in self.__dirty_generations if key[0] != subreddit
+            }
+            for post_id in [post_id for post_id, (owner, _) in self.__comment_windows.items()
+                            if owner == subreddit]:
+                del self.__comment_windows[post_id]
+            for key in [key for key in self.__cursors if key[0] == subreddit]:
+                del self.__cursors[key]
+                self.__dirty_cursors.discard(key)
+
+            for post_id, row in list(self.__post_inserts.items()):
+                if row[2] == subreddit:
+                    del self.__post_inserts[post_id]
+            for key, row in list(self.__comment_inserts.items()):
+                if row[3] == subreddit:
+                    del self.__comment_inserts[key]
+
+def get_seen_window() -> SeenWindow:
+    global _seen_window
+
+    if _seen_window is None:
+        with _seen_window_lock:
+            if _seen_window is None:
+                _seen_window = SeenWindow()
+
+    return _seen_window
+
+def reset_seen_window():
+    '''
+    drops the in-memory window, and with it every change not yet checkpointed,
+    the next get_seen_window() reloads from the tables
+    '''
+    global _seen_window
+
+    with _seen_window_lock:
+        _seen_window = None
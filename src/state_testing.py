@@ -0,0 +1,396 @@
+import argparse
+import contextlib
+import db_config
+import io
+import metrics
+import mention_writer
+from pathlib import Path
+import rate_limiter
+from rate_limiter import RateLimiter
+from scraper import ScrapedItem
+import seen_filter
+from seen_filter import SeenFilter
+import seen_window
+from seen_window import Window, get_seen_window, reset_seen_window
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+"""
+checks the stateful parts of the pipeline that the benchmarks only exercise
+indirectly, the seen window (trimming, comment window eviction, checkpointing and
+dropping unsaved changes after a failed scrape), the rotating seen filter, the
+mention writer (batching, flush and failed writes) and the rate limiter (the token
+bucket, Reddit's headers, 429 pauses and backoff)
+
+every check runs against a fresh database in a temporary folder which is removed
+afterwards, the real database is never touched...the first failure is printed and
+the script exits with an error
+
+run from the src folder:
+    python3 state_testing.py
+    python3 state_testing.py --only seen_window
+"""
+
+# slack allowed on the rate limiter's waits, the checks sleep for real
+TIMING_TOLERANCE = 0.05  # seconds
+
+def expect(condition: bool, message: str):
+    if not condition:
+        raise AssertionError(message)
+
+def fresh_database(work_dir: Path, name: str):
+    '''
+    points db_config at a new empty database and drops everything held on to
+    from the previous one
+    '''
+    reset_seen_window()
+    db_config.close_connections()
+    db_config.DB_PATH = work_dir / name / "reddit_ticker_data.db"
+
+    # initialise_db reports creating the database, which is expected here
+    with contextlib.redirect_stdout(io.StringIO()):
+        db_config.get_db_path()
+
+def count_rows(table: str) -> int:
+    return db_config.get_connection().execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+def posts(*ids_and_timestamps) -> list[dict]:
+    return [{"id": post_id, "created_utc": timestamp} for post_id, timestamp in ids_and_timestamps]
+
+def comments(post_id: str, *ids_and_timestamps) -> list[dict]:
+    return [
+        {"id": comment_id, "created_utc": timestamp, "link_id": f"t3_{post_id}"}
+        for comment_id, timestamp in ids_and_timestamps
+    ]
+
+def check_seen_window(work_dir: Path):
+    fresh_database(work_dir, "seen_window")
+
+    window = Window()
+    for item_id, timestamp in (("c", 3), ("a", 1), ("e", 5), ("b", 2), ("d", 4)):
+        window.add(item_id, timestamp)
+    expect(window.trim(3) == ["a", "b"], "Window.trim did not drop the oldest ids first.")
+    expect(window.ids == {"c", "d", "e"}, f"Window kept {window.ids} after trimming to 3.")
+    expect(window.trim(3) == [], "Window.trim dropped ids from a window already within keep.")
+
+    # only new posts are returned, and the window is trimmed to keep
+    seen = get_seen_window()
+    new_posts = seen.record_posts("stocks", posts(("p1", 1), ("p2", 2), ("p3", 3)), keep=2)
+    expect([post["id"] for post in new_posts] == ["p1", "p2", "p3"], "New posts were not all returned.")
+    new_posts = seen.record_posts("stocks", posts(("p2", 2), ("p3", 3), ("p4", 4)), keep=2)
+    expect([post["id"] for post in new_posts] == ["p4"], "Posts already in the window were returned.")
+    expect(set(seen.newest_posts("stocks", 10)) == {"p3", "p4"}, "Post window was not trimmed to keep.")
+
+    # nothing reaches the tables until the checkpoint
+    expect(count_rows("post_cache") == 0, "Posts were written before the checkpoint.")
+    seen.save_cursor("stocks", "new", "t3_p4", 4.0, 10.0)
+    seen.checkpoint()
+    post_ids = {row[0] for row in db_config.get_connection().execute("SELECT post_id FROM post_cache")}
+    expect(post_ids == {"p3", "p4"}, f"Checkpoint left {post_ids} in post_cache, expected p3 and p4.")
+    expect(count_rows("listing_cursors") == 1, "Checkpoint did not write the listing cursor.")
+
+    # a reload starts from what was checkpointed
+    reset_seen_window()
+    seen = get_seen_window()
+    expect(set(seen.newest_posts("stocks", 10)) == {"p3", "p4"}, "Reloaded post window differs.")
+    expect(seen.read_cursor("stocks", "new") == ("t3_p4", 4.0, 10.0), "Reloaded cursor differs.")
+    seen.save_cursor("stocks", "new", "t3_p1", 1.0, 11.0)
+    expect(seen.read_cursor("stocks", "new")[0] == "t3_p4", "A cursor was moved backwards.")
+
+    # a post trimmed out of the window is not new when it comes back
+    new_posts = seen.record_posts("stocks", posts(("p1", 1)), keep=2)
+    expect(not new_posts, "A post that left the window was returned as new again.")
+
+    # a failed scrape is never checkpointed, resetting drops everything it recorded
+    seen.record_posts("stocks", posts(("p5", 5)), keep=2)
+    reset_seen_window()
+    seen = get_seen_window()
+    new_posts = seen.record_posts("stocks", posts(("p5", 5)), keep=2)
+    expect([post["id"] for post in new_posts] == ["p5"], "A post recorded by a failed scrape stayed seen.")
+
+    # and a checkpoint that fails part way writes nothing at all, seen_filters is
+    # the last table it writes
+    seen.save_cursor("stocks", "comments", "t1_x", 5.0, 12.0)
+    seen.record_comments("stocks", comments("p5", ("x", 5)), keep=10)
+    connection = db_config.get_connection()
+    connection.execute("ALTER TABLE seen_filters RENAME TO seen_filters_hidden")
+    try:
+        # checkpoint prints the failure before raising it
+        with contextlib.redirect_stdout(io.StringIO()):
+            seen.checkpoint()
+        failed = False
+    except sqlite3.Error:
+        failed = True
+    finally:
+        connection.execute("ALTER TABLE seen_filters_hidden RENAME TO seen_filters")
+    expect(failed, "Checkpoint did not fail without its seen_filters table.")
+    post_ids = {row[0] for row in connection.execute("SELECT post_id FROM post_cache")}
+    expect(post_ids == {"p3", "p4"}, f"A failed checkpoint changed post_cache to {post_ids}.")
+    expect(count_rows("comment_cache") == 0, "A failed checkpoint wrote its comments.")
+    expect(count_rows("listing_cursors") == 1, "A failed checkpoint wrote its listing cursor.")
+
+    # comment windows beyond MAX_COMMENT_WINDOWS are dropped after the
+    # checkpoint and reloaded from comment_cache when their post comes back
+    reset_seen_window()
+    max_comment_windows = seen_window.MAX_COMMENT_WINDOWS
+    seen_window.MAX_COMMENT_WINDOWS = 2
+    try:
+        seen = get_seen_window()
+        for index in range(4):
+            post_id = f"q{index}"
+            post_comments = comments(post_id, (f"{post_id}c1", index), (f"{post_id}c2", index))
+            seen.record_comments("stocks", post_comments, keep=10, post_id=post_id)
+        seen.checkpoint()
+        expect(count_rows("comment_cache") == 8, "Checkpoint did not write every comment.")
+
+        # rows only a window reloaded from the table can know about
+        db_config.get_connection().executemany(
+            "INSERT INTO comment_cache VALUES (?, ?, 0, 'stocks')", [("q0c9", "q0"), ("q3c9", "q3")]
+        )
+        db_config.get_connection().commit()
+        snapshot = seen.seen_comment_ids("stocks", ["q0", "q3"])
+        expect(snapshot["q0"] == {"q0c1", "q0c2", "q0c9"},
+               "The least recently used comment window was not dropped and reloaded.")
+        expect(snapshot["q3"] == {"q3c1", "q3c2"}, "A recently used comment window was dropped.")
+        new_comments = seen.record_comments("stocks", comments("q0", ("q0c2", 0), ("q0c3", 9)), keep=10)
+        expect([comment["id"] for comment in new_comments] == ["q0c3"],
+               "A reloaded comment window returned a seen comment as new.")
+    finally:
+        seen_window.MAX_COMMENT_WINDOWS = max_comment_windows
+
+def check_seen_filter(work_dir: Path):
+    fresh_database(work_dir, "seen_filter")
+
+    # a generation per ROTATION_PERIOD, the oldest dropped beyond GENERATIONS
+    ring = SeenFilter()
+    for week in range(seen_filter.GENERATIONS + 2):
+        ring.add(f"t3_week{week}", now=week * seen_filter.ROTATION_PERIOD)
+    expect(len(ring.generations) == seen_filter.GENERATIONS,
+           f"{len(ring.generations)} generations kept, expected {seen_filter.GENERATIONS}.")
+    expect("t3_week0" not in ring and "t3_week1" not in ring,
+           "Items from rotated out generations are still reported as seen.")
+    expect(all(f"t3_week{week}" in ring for week in range(2, seen_filter.GENERATIONS + 2)),
+           "Items from the kept generations are no longer reported as seen.")
+    expect(not ring.add(f"t3_week{seen_filter.GENERATIONS + 1}", now=seen_filter.GENERATIONS + 1),
+           "Adding an item already in the newest generation reported a change.")
+
+    # and an early one once the newest is at CAPACITY
+    capacity = seen_filter.CAPACITY
+    seen_filter.CAPACITY = 100
+    try:
+        ring = SeenFilter()
+        for index in range(250):
+            ring.add(f"t1_{index}", now=0.0)
+        expect(len(ring.generations) == 3,
+               f"{len(ring.generations)} generations after 250 items, expected 3.")
+    finally:
+        seen_filter.CAPACITY = capacity
+
+    # no false negatives, and false positives within the configured rate
+    ring = SeenFilter()
+    for index in range(seen_filter.CAPACITY):
+        ring.add(f"t1_seen{index}", now=0.0)
+    expect(all(f"t1_seen{index}" in ring for index in range(0, seen_filter.CAPACITY, 7)),
+           "An item added to the filter is not reported as seen.")
+    probes = 100000
+    false_positives = sum(f"t1_unseen{index}" in ring for index in range(probes))
+    expect(false_positives / probes <= seen_filter.FALSE_POSITIVE_RATE,
+           f"{false_positives} false positives in {probes} lookups, above the configured rate.")
+
+    # the generations are checkpointed with the window and survive a reload
+    seen = get_seen_window()
+    seen.record_posts("stocks", posts(("old", 1), ("mid", 2), ("new", 3)), keep=1)
+    seen.checkpoint()
+    expect(count_rows("seen_filters") == 1, "Checkpoint did not write the filter's generation.")
+    reset_seen_window()
+    seen = get_seen_window()
+    expect(not seen.record_posts("stocks", posts(("old", 1)), keep=1),
+           "A post that left the window was new again after the filter was reloaded.")
+
+def check_mention_writer(work_dir: Path):
+    fresh_database(work_dir, "mention_writer")
+
+    def item(index: int) -> ScrapedItem:
+        return ScrapedItem(text="", post_id=f"p{index}", timestamp=index, subreddit="stocks",
+                           comment_id=f"c{index}")
+
+    # flush commits everything put so far and reports what was ignored
+    writer = mention_writer.MentionWriter(batch_size=1000, flush_interval=60.0)
+    try:
+        for index in range(10):
+            writer.put(item(index), {"AAPL", "TSLA"})
+        expect(writer.flush() == (20, 0), "Flush did not report 20 mentions inserted.")
+        expect(count_rows("mentions") == 20, "Flush returned before every mention was committed.")
+        for index in range(10):
+            writer.put(item(index), {"AAPL", "TSLA"})
+        expect(writer.flush() == (0, 20), "Mentions recorded twice were not reported as ignored.")
+    finally:
+        writer.close()
+
+    # a batch is written once full, or once its oldest item has waited long enough
+    writer = mention_writer.MentionWriter(batch_size=1000, flush_interval=0.05)
+    try:
+        writer.put(item(100), {"NVDA"})
+        deadline = time.monotonic() + 2.0
+        while count_rows("mentions") == 20 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        expect(count_rows("mentions") == 21, "A batch was not written after flush_interval.")
+        writer.flush()
+    finally:
+        writer.close()
+
+    record_mentions = mention_writer.record_mentions
+    batches = []
+    failing = threading.Event()
+    released = threading.Event()
+
+    def fake_record_mentions(batch: list) -> tuple[int, int]:
+        released.wait()
+        if failing.is_set():
+            raise RuntimeError("disk full")
+        batches.append(len(batch))
+        return len(batch), 0
+
+    mention_writer.record_mentions = fake_record_mentions
+    try:
+        released.set()
+        writer = mention_writer.MentionWriter(batch_size=3, flush_interval=60.0)
+        for index in range(7):
+            writer.put(item(index), {"AAPL"})
+        expect(writer.flush() == (7, 0) and batches == [3, 3, 1],
+               f"Batches of {batches} written, expected [3, 3, 1].")
+
+        # a failed write is raised from the next flush, then the writer carries on
+        failing.set()
+        writer.put(item(0), {"AAPL"})
+        try:
+            writer.flush()
+            raise AssertionError("A failed write was not raised from flush.")
+        except RuntimeError:
+            pass
+        failing.clear()
+        writer.put(item(1), {"AAPL"})
+        expect(writer.flush() == (1, 0), "The writer did not carry on after a failed write was raised.")
+
+        # or from the next put, the items queued behind it are dropped
+        failing.set()
+        for index in range(3):
+            writer.put(item(index), {"AAPL"})
+        deadline = time.monotonic() + 2.0
+        try:
+            while time.monotonic() < deadline:
+                writer.put(item(3), {"AAPL"})
+                time.sleep(0.01)
+            raise AssertionError("A failed write was not raised from put.")
+        except RuntimeError:
+            pass
+        failing.clear()
+        batches.clear()
+        try:
+            writer.flush()
+        except RuntimeError:
+            pass
+        expect(writer.flush() == (0, 0) and not batches, "Items queued behind a failed write were written.")
+        writer.close()
+
+        # a full queue blocks put, which is recorded as write_backpressure
+        released.clear()
+        writer = mention_writer.MentionWriter(batch_size=1, flush_interval=60.0, queue_size=1)
+        metrics.start_run()
+        threading.Timer(0.1, released.set).start()
+        for index in range(4):
+            writer.put(item(index), {"AAPL"})
+        writer.flush()
+        writer.close()
+        backpressure = metrics.run_summary().get("write_backpressure")
+        expect(backpressure is not None and backpressure["seconds"] >= 0.05,
+               "A put blocked on a full queue was not recorded as write_backpressure.")
+    finally:
+        released.set()
+        mention_writer.record_mentions = record_mentions
+
+def check_rate_limiter(work_dir: Path):
+    def waited(limiter: RateLimiter, count: int) -> float:
+        start = time.monotonic()
+        for _ in range(count):
+            limiter.acquire()
+            limiter.release(200)
+        return time.monotonic() - start
+
+    # a burst goes out at once, the rest at the configured rate
+    limiter = RateLimiter(requests_per_second=20, burst=5)
+    expect(waited(limiter, 5) < TIMING_TOLERANCE, "The first burst requests were held back.")
+    elapsed = waited(limiter, 4)
+    expect(abs(elapsed - 0.2) < TIMING_TOLERANCE, f"4 requests at 20/s took {elapsed:.3f}s, expected 0.2s.")
+
+    # Reddit's headers set the rate that spends what is left by the window reset
+    limiter = RateLimiter(requests_per_second=1, burst=5)
+    limiter.acquire()
+    limiter.release(200, {"X-Ratelimit-Remaining": "50", "X-Ratelimit-Reset": "10"})
+    expect(abs(limiter.requests_per_second - 5.0) < 1e-9,
+           f"Rate of {limiter.requests_per_second}/s from the headers, expected 5/s.")
+
+    # an exhausted window pauses every caller until it resets, the bucket is empty
+    # then and refills at the configured rate, so one more token's worth on top
+    limiter = RateLimiter(requests_per_second=100, burst=5)
+    limiter.acquire()
+    limiter.release(200, {"X-Ratelimit-Remaining": "0", "X-Ratelimit-Reset": "0.2"})
+    elapsed = waited(limiter, 1)
+    expect(abs(elapsed - 0.21) < TIMING_TOLERANCE, f"Exhausted window paused {elapsed:.3f}s, expected 0.21s.")
+
+    # as does a 429, for Retry-After
+    limiter = RateLimiter(requests_per_second=100, burst=5)
+    limiter.acquire()
+    limiter.release(429, {"Retry-After": "0.15"})
+    elapsed = waited(limiter, 1)
+    expect(abs(elapsed - 0.16) < TIMING_TOLERANCE, f"429 paused {elapsed:.3f}s, expected 0.16s.")
+    expect(rate_limiter.retry_after_seconds({"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"}) is None,
+           "An HTTP date Retry-After was not ignored.")
+
+    # full jitter backoff, capped
+    limiter = RateLimiter(backoff_base=1.0, backoff_cap=8.0)
+    for attempt in range(6):
+        delays = [limiter.backoff(attempt) for _ in range(200)]
+        ceiling = min(8.0, 2 ** attempt)
+        expect(all(0 <= delay <= ceiling for delay in delays),
+               f"Backoff for attempt {attempt} went outside 0 to {ceiling}s.")
+        expect(max(delays) > ceiling / 2 and min(delays) < ceiling / 2,
+               f"Backoff for attempt {attempt} is not spread over 0 to {ceiling}s.")
+
+CHECKS = {
+    "seen_window": check_seen_window,
+    "seen_filter": check_seen_filter,
+    "mention_writer": check_mention_writer,
+    "rate_limiter": check_rate_limiter,
+}
+
+def main():
+    parser = argparse.ArgumentParser(description="Checks of the pipeline's stateful components")
+    parser.add_argument("--only", choices=CHECKS, action="append",
+                        help="run only these checks (repeatable), all by default")
+    args = parser.parse_args()
+
+    work_dir = Path(tempfile.mkdtemp(prefix="state_testing_"))
+    db_path = db_config.DB_PATH
+
+    try:
+        for name in args.only or CHECKS:
+            CHECKS[name](work_dir)
+            print(f"{name}: all checks passed.")
+
+    except AssertionError as e:
+        print(f"FATAL ERROR: {e}")
+        sys.exit(1)
+
+    finally:
+        reset_seen_window()
+        db_config.close_connections()
+        db_config.DB_PATH = db_path
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
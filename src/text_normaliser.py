@@ -0,0 +1,40 @@
+import re
+
+"""
+turns the raw markdown of a post or comment into the plain text the extractor
+reads, with patterns compiled once at import: fenced code blocks and quoted lines
+(">" or, as Reddit escapes it, "&gt;") are dropped, links keep their text but
+lose their target, URLs are removed, then every run of whitespace becomes a
+single space
+
+markup is looked for only when the text contains one of the characters it starts
+with, which most comments don't, and the URL removal and whitespace collapse are
+plain string substitutions that stay in C...so for text without markdown this is
+exactly, and about as fast as, the old URL removal followed by whitespace
+collapsing (see normaliser_benchmark.py)
+"""
+
+MARKUP_PATTERN = re.compile(
+    r"(?P<block>```.*?```|^[ \t]*(?:>|&gt;)[^\n]*)"
+    r"|\[(?P<label>[^\]\n]*)\]\([^)\n]*\)",
+    re.DOTALL | re.MULTILINE
+)
+URL_PATTERN = re.compile(r"http\S+|www\S+")
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+def _replace_markup(match: re.Match) -> str:
+    label = match.group("label")
+    # a dropped block still separates the words either side of it
+    return " " if label is None else label
+
+def normalise_text(text: str) -> str:
+    if "`" in text or ">" in text or "&gt;" in text or "](" in text:
+        text = MARKUP_PATTERN.sub(_replace_markup, text)
+    text = URL_PATTERN.sub("", text)
+
+    return WHITESPACE_PATTERN.sub(" ", text)
+
+def normalise_post(title: str, selftext: str) -> str:
+    # the body starts on a line of its own, so a quote opening it is still
+    # found at the start of a line, and the line break collapses to a space
+    return normalise_text(title + "\n" + selftext)
@@ -1,14 +1,27 @@
-from db_config import get_db_path
-import sqlite3
+from db_config import get_connection
+from lexicon import Lexicon, get_source_fingerprint, hash_sources, load_lexicon
+import metrics
 import re
+import threading
 
 """
 takes title and body of post/comment and checks for tickers, then validates
-those tickers against NASDAQ ticker list, returning valid tickers
+those tickers against the compiled lexicon of the NASDAQ ticker list and our
+blacklists, returning valid tickers
 
-also handles the recording of valid ticker mentions into the db's mentions table
+also handles the recording of valid ticker mentions into the db's mentions table,
+record_mentions is a module function since it doesn't depend on the lexicon
+
+the extractor is a process-lifetime object, get_ticker_extractor hands out the
+active one and only builds a replacement when the ticker list or blacklists have
+actually changed, swapping it in with a single reference assignment...a scrape
+holds on to the extractor it started with, so it never sees a mix of two versions
 """
 
+_active_extractor = None
+_active_fingerprint = None
+_reload_lock = threading.Lock()
+
 class TickerExtractor:
     """
     PATTERN includes all 1-5 letter strings not preceded or succeeded by a 
@@ -18,78 +31,107 @@ class TickerExtractor:
     """
     PATTERN = re.compile(r"(?<![a-zA-Z0-9'’&])[a-zA-Z]{1,5}(?:[./-^][a-zA-Z]{1,2})?(?![a-zA-Z0-9&])")
     
-    def __init__(self, blacklisted_words: set[str], regular_words: set[str], random_words_dc: set[str], ticker_list: set[str]):
-        self.__blacklisted_words = blacklisted_words
-        self.__regular_words = regular_words
-        self.__random_words_dc = random_words_dc
-        self.__ticker_list = ticker_list
+    def __init__(self, lexicon: Lexicon):
+        self.__lexicon = lexicon
+        self.__entries = lexicon.entries
+    
+    @property
+    def lexicon(self) -> Lexicon:
+        return self.__lexicon
+    
+    @property
+    def version(self) -> str:
+        return self.__lexicon.version
     
     def extract(self, content: str) -> set[str]:
-        match_count = 0
-        raw_matches = self.PATTERN.findall(content)
+        entries = self.__entries
         valid_tickers = set()
         
-        for word in raw_matches:
-            # normalise potential ticker formats to match those in our own ticker list
-            normalised_word = word.replace('.', '/').replace('-', '/')
-            upper_word = normalised_word.upper()
-            
-            if upper_word in self.__blacklisted_words:
+        # a single scan of the text, each match costs one uppercase and one lookup
+        for word in self.PATTERN.findall(content):
+            entry = entries.get(word.upper())
+            if entry is None:
                 continue
             
-            if upper_word in self.__ticker_list:
-                # only accept a regular or random_dc word ticker if it's fully uppercase,
-                # otherwise just skip it, logic here is that if user meant the ticker,
-                # they would likely write it in all caps to distinguish it since the
-                # word is either a regular word or commonly lowercased abbreviation/slang
-                if upper_word in self.__regular_words or upper_word in self.__random_words_dc:
-                    if word.isupper():
-                        valid_tickers.add(upper_word)
-                else:
-                    valid_tickers.add(upper_word)
+            ticker, code = entry
+            # only accept a regular or random_dc word ticker if it's fully uppercase,
+            # logic here is that if user meant the ticker, they would likely write it
+            # in all caps to distinguish it since the word is either a regular word
+            # or commonly lowercased abbreviation/slang
+            if code == Lexicon.TICKER or (code == Lexicon.CASE_SENSITIVE_TICKER and word.isupper()):
+                valid_tickers.add(ticker)
 
         return valid_tickers
+
+def record_mentions(extracted_items: list[tuple]) -> tuple[int, int]:
+    '''
+    records every (post_or_comment, tickers) pair given in one transaction, a
+    whole backfill checkpoint or one batch of the mention writer, mentions that
+    were already recorded are ignored by the unique index on the mentions table
+    rather than looked up first...check README, section Post Reprocessing Issue,
+    for why that happens at all
     
-    def record_mentions(self, post_or_comment, tickers: set[str]):
-        # ensures we don't get an UnboundLocalError if connection in the except block
-        connection = None
-        
-        try:
-            connection = sqlite3.connect(get_db_path())
+    returns the number of mentions inserted and the number ignored
+    '''
+    # ensures we don't get an UnboundLocalError if connection in the except block
+    connection = None
+    
+    mention_rows = [
+        (item.post_id, item.comment_id, ticker, item.subreddit, item.timestamp)
+        for item, tickers in extracted_items
+        for ticker in tickers
+    ]
+    if not mention_rows:
+        return 0, 0
+    
+    try:
+        with metrics.timed("db_write", table="mentions") as timer:
+            connection = get_connection()
             cursor = connection.cursor()
             
-            post_id = post_or_comment.post_id
-            comment_id = post_or_comment.comment_id
-            timestamp = post_or_comment.timestamp
-            subreddit = post_or_comment.subreddit
+            cursor.executemany(
+                '''INSERT OR IGNORE INTO mentions (post_id, comment_id, ticker_symbol,
+                subreddit, mention_timestamp) VALUES (?, ?, ?, ?, ?)''',
+                mention_rows
+            )
+            inserted = cursor.rowcount
             
-            for ticker in tickers:
-                cursor.execute(
-                    '''SELECT id FROM mentions WHERE post_id = ? AND comment_id IS ? 
-                    AND ticker_symbol = ?''',
-                    (post_id, comment_id, ticker)
-                )
-                cursor_result = cursor.fetchone()
-                is_new = cursor_result is None
-                
-                if is_new:
-                    cursor.execute(
-                        '''INSERT INTO mentions (post_id, comment_id, ticker_symbol,
-                        subreddit, mention_timestamp) VALUES (?, ?, ?, ?, ?)''',
-                        (post_id, comment_id, ticker, subreddit, timestamp)
-                    )
-                else:
-                    # check README, section Post Reprocessing Issue, for explanation
-                    print("INFO: Scraper returned a previously recorded " 
-                          f"ScrapedItem from {subreddit}. Post id: {post_id} and "
-                          f"Comment id: {comment_id}")
-                    
             connection.commit()
+            timer.items = inserted
+        
+        return inserted, len(mention_rows) - inserted
+        
+    except Exception as e:
+        print(f"FATAL ERROR: Failed to record ticker mentions: {e}")
+        # the connection outlives this call, so a half-written transaction
+        # must not be left open on it
+        if connection:
+            connection.rollback()
+        raise
+
+def get_ticker_extractor() -> TickerExtractor:
+    global _active_extractor, _active_fingerprint
+    
+    # the common case, nothing on disk was touched since the last call
+    fingerprint = get_source_fingerprint()
+    if _active_extractor is not None and fingerprint == _active_fingerprint:
+        return _active_extractor
+    
+    with _reload_lock:
+        # another thread may have reloaded while we waited on the lock
+        if _active_extractor is not None and fingerprint == _active_fingerprint:
+            return _active_extractor
+        
+        # a touched file with identical content (e.g. the daily ticker list
+        # download returning the same symbols) keeps the current extractor
+        version = hash_sources()
+        if _active_extractor is None or version != _active_extractor.version:
+            previous_version = _active_extractor.version if _active_extractor else None
+            _active_extractor = TickerExtractor(load_lexicon(version))
             
-        except Exception as e:
-            print(f"FATAL ERROR: Failed to record ticker mention: {e}")
-            
-        finally:
-            if connection:
-                connection.close()
-        
\ No newline at end of file
+            if previous_version:
+                print(f"Ticker extractor reloaded: lexicon {previous_version} -> {version}")
+        
+        _active_fingerprint = fingerprint
+    
+    return _active_extractor
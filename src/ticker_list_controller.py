@@ -1,10 +1,21 @@
 import csv
+import hashlib
+import http_client
+import io
+import json
+import metrics
 from pathlib import Path
-import requests
+import time
 
 CURRENT_DIR = Path(__file__).resolve()
 TICKERS_PATH = CURRENT_DIR.parent.parent / "tickers"
 TICKER_LIST_FILE = TICKERS_PATH / "ticker_list.csv"
+# the ETag/Last-Modified of the download the ticker list was written from, sent
+# back on the next download so an unchanged list costs a 304 and no body, and the
+# hash of the list as written, so an unchanged list is never rewritten
+DOWNLOAD_STATE_FILE = TICKERS_PATH / "ticker_list_download.json"
+# one JSON line per change to the ticker list, with the symbols added and removed
+CHANGES_FILE = TICKERS_PATH / "ticker_list_changes.jsonl"
 
 # Nasdaq blocks basic requests calls, so we must mimic a browser
 HEADERS = {
@@ -24,39 +35,128 @@ TIMEOUT = 5
 URL = "https://api.nasdaq.com/api/screener/stocks?tableonly=true&limit=0&download=true"
 FILE_NAME = "ticker_list.csv"
 
-def fetch_ticker_list():
+def fetch_ticker_list() -> dict:
+    '''
+    downloads the ticker list and saves it if it changed, returns the symbols
+    added and removed, both empty when nothing changed
+    '''
     try:
-        response = requests.get(URL, headers=HEADERS, timeout=TIMEOUT)
-        # raises an HTTPError if the response was unsuccessful (400 or 500 codes)
-        response.raise_for_status()
-        response_json = response.json()
+        # without a list on disk there is nothing to compare against
+        download_state = load_download_state() if TICKER_LIST_FILE.exists() else {}
 
-        ticker_rows = response_json["data"]["rows"]
-        if not ticker_rows:
-            raise ValueError("Received an empty ticker list from Nasdaq API")
+        headers = dict(HEADERS)
+        if download_state.get("etag"):
+            headers["If-None-Match"] = download_state["etag"]
+        if download_state.get("last_modified"):
+            headers["If-Modified-Since"] = download_state["last_modified"]
+
+        with metrics.timed("fetch", endpoint="screener") as timer:
+            response = http_client.get(URL, headers=headers, timeout=TIMEOUT)
+            if response.status_code == 304:
+                print("Ticker list not modified since the last download.")
+                return {"added": [], "removed": []}
+
+            # raises an HTTPError if the response was unsuccessful (400 or 500 codes)
+            response.raise_for_status()
+            response_json = response.json()
+
+            ticker_rows = response_json["data"]["rows"]
+            if not ticker_rows:
+                raise ValueError("Received an empty ticker list from Nasdaq API")
+            timer.items = len(ticker_rows)
+            timer.bytes = len(response.content)
 
         # extract just the symbols
         tickers = [ticker["symbol"] for ticker in ticker_rows]
-        load_ticker_list_into_csv(tickers)
+        content_hash, changes = load_ticker_list_into_csv(
+            tickers, download_state.get("content_hash")
+        )
+        save_download_state({
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "content_hash": content_hash,
+        })
 
-        print(f"Successfully retrieved and saved {len(tickers)} tickers.")
+        if changes is None:
+            print(f"Successfully retrieved {len(tickers)} tickers, the saved list is unchanged.")
+            return {"added": [], "removed": []}
+
+        print(
+            f"Successfully retrieved and saved {len(tickers)} tickers "
+            f"({len(changes['added'])} added, {len(changes['removed'])} removed)."
+        )
+        return changes
 
     except Exception as e:
         print(f"FATAL ERROR: Failed to retrieve tickers: {e}")
         raise
 
-def load_ticker_list_into_csv(tickers: list[str]):
+def load_download_state() -> dict:
+    try:
+        return json.loads(DOWNLOAD_STATE_FILE.read_text())
+    except (OSError, ValueError):
+        # the download is then unconditional and the list compared by content
+        return {}
+
+def save_download_state(download_state: dict):
+    try:
+        DOWNLOAD_STATE_FILE.write_text(json.dumps(download_state))
+    except OSError as e:
+        print(f"NON-FATAL ERROR: Could not save the ticker list download state: {e}")
+
+def load_ticker_list_into_csv(tickers: list[str], previous_hash: str = None) -> tuple:
+    '''
+    writes the list, sorted, unless its hash matches previous_hash (the hash of
+    what was last written), so an unchanged download leaves the file and its
+    modification time, which the lexicon watches, alone...returns the new hash
+    and the symbols added and removed, or None for the latter when nothing changed,
+    every change is also appended to CHANGES_FILE
+    '''
     try:
         TICKERS_PATH.mkdir(parents=True, exist_ok=True)
-        
-        with open(TICKER_LIST_FILE, 'w', newline='') as tickers_csv:
-            writer = csv.writer(tickers_csv)
-            writer.writerow(["Ticker Symbol"])
-            writer.writerows([[ticker] for ticker in tickers])
+
+        contents = io.StringIO(newline="")
+        writer = csv.writer(contents)
+        writer.writerow(["Ticker Symbol"])
+        writer.writerows([[ticker] for ticker in sorted(set(tickers))])
+        new_list = contents.getvalue().encode()
+
+        content_hash = hashlib.blake2b(new_list, digest_size=16).hexdigest()
+        if content_hash == previous_hash and TICKER_LIST_FILE.exists():
+            return content_hash, None
+
+        old_tickers = load_ticker_list_from_csv() if TICKER_LIST_FILE.exists() else set()
+
+        # written under a temporary name and renamed over the old list, the rename
+        # is atomic so a reader only ever sees the old or the new list, never half
+        # of one
+        temp_file = TICKER_LIST_FILE.with_suffix(".tmp")
+        temp_file.write_bytes(new_list)
+        temp_file.replace(TICKER_LIST_FILE)
 
     except Exception as e:
         print(f"FATAL ERROR: Could not save tickers to CSV: {e}")
         raise
+
+    new_tickers = set(tickers)
+    changes = {
+        "added": sorted(new_tickers - old_tickers),
+        "removed": sorted(old_tickers - new_tickers),
+    }
+    # a first sorted rewrite of an old, unsorted list changes no symbols
+    if changes["added"] or changes["removed"]:
+        record_changes(changes)
+
+    return content_hash, changes
+
+def record_changes(changes: dict):
+    try:
+        with open(CHANGES_FILE, "a") as changes_file:
+            changes_file.write(json.dumps({"changed_at": int(time.time()), **changes}) + "\n")
+
+    except OSError as e:
+        # the list itself was saved, only its history misses an entry
+        print(f"NON-FATAL ERROR: Could not record ticker list changes: {e}")
     
 def load_ticker_list_from_csv() -> set:
     try:
@@ -71,7 +171,7 @@ def load_ticker_list_from_csv() -> set:
                 ticker = row[0]
                 tickers.add(ticker)
                 
-        return sorted(tickers)
+        return tickers
     
     except Exception as e:
         print(f"FATAL ERROR: Could not load tickers from CSV: {e}")